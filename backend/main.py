@@ -1,13 +1,19 @@
 import os  # <-- 1. Import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import motor.motor_asyncio
+from pymongo.errors import PyMongoError
 from backend.utils.db import MONGO_URI, DATABASE_NAME
+from backend.utils.analytics import AnalyticsEngine
+from backend.utils import job_store, anomaly, idempotency, task_queue
+from backend.utils.middleware import GZipRequestMiddleware
+from backend.utils.deadline import DeadlineMiddleware
 import logging
 
 # Import your routers
 from backend.routers import printers, auth, jobs, settings, inventory
-from backend.routers import ink_fills
+from backend.routers import ink_fills, exports, analytics, tasks
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +26,12 @@ app = FastAPI(title="Web-Based Intelligent Printer Log Monitoring and Analytics
 async def startup_db_client():
     app.mongodb_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
     app.db = app.mongodb_client[DATABASE_NAME]
+    app.analytics = AnalyticsEngine()
+    await job_store.ensure_collection(app.db)
+    await anomaly.ensure_indexes(app.db)
+    await idempotency.ensure_indexes(app.db)
+    await task_queue.ensure_indexes(app.db)
+    await printers.ensure_indexes(app.db)
     logger.info(f"Successfully connected to MongoDB database: {DATABASE_NAME}")
 
 @app.on_event("shutdown")
@@ -41,6 +53,11 @@ if FRONTEND_URL:
     origins.append(FRONTEND_URL)
     logger.info(f"Allowing CORS for deployed frontend: {FRONTEND_URL}")
 
+# Middleware added last runs first: CORS, then deadlines and load shedding
+# (before any body is read), then decompression of gzipped agent uploads.
+app.add_middleware(GZipRequestMiddleware)
+app.add_middleware(DeadlineMiddleware)
+
 # --- CORS Middleware (Updated) ---
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +69,14 @@ app.add_middleware(
 
 # --- END FIX ---
 
+# --- Deadline Errors ---
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request, exc: PyMongoError):
+    # The driver enforces the request deadline set by DeadlineMiddleware.
+    if exc.timeout:
+        return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+    raise exc
+
 # --- Include Routers ---
 app.include_router(auth.router)
 app.include_router(printers.router)
@@ -59,6 +84,9 @@ app.include_router(jobs.router)
 app.include_router(settings.router)
 app.include_router(inventory.router)
 app.include_router(ink_fills.router)
+app.include_router(exports.router)
+app.include_router(analytics.router)
+app.include_router(tasks.router)
 
 # --- Root Endpoint ---
 @app.get("/", tags=["Root"])
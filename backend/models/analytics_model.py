@@ -0,0 +1,51 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, List, Literal, Optional
+
+class AnalyticsFilter(BaseModel):
+    """A single row filter, e.g. {"field": "print_mode", "op": "eq", "value": "Quality"}."""
+    field: str
+    op: Literal["eq", "ne", "gt", "gte", "lt", "lte", "in"] = "eq"
+    value: Any
+
+class AnalyticsMetric(BaseModel):
+    """
+    An aggregate to compute per group.
+    `ratio` divides the group sum of `field` by the group sum of `per`,
+    e.g. total_ink_ml per printed_area_sqm.
+    """
+    agg: Literal["count", "sum", "mean", "min", "max", "percentile", "ratio"]
+    field: Optional[str] = None
+    q: Optional[float] = Field(None, ge=0, le=100, description="Percentile to compute, 0-100")
+    per: Optional[str] = Field(None, description="Denominator field for 'ratio'")
+    alias: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_arguments(self):
+        if self.agg != "count" and not self.field:
+            raise ValueError(f"'{self.agg}' requires a field")
+        if self.agg == "percentile" and self.q is None:
+            raise ValueError("'percentile' requires q")
+        if self.agg == "ratio" and not self.per:
+            raise ValueError("'ratio' requires per")
+        return self
+
+    @property
+    def name(self) -> str:
+        if self.alias:
+            return self.alias
+        if self.agg == "count":
+            return "count"
+        if self.agg == "percentile":
+            return f"p{self.q:g}_{self.field}"
+        if self.agg == "ratio":
+            return f"{self.field}_per_{self.per}"
+        return f"{self.agg}_{self.field}"
+
+class AnalyticsQuery(BaseModel):
+    """Body of POST /analytics/query."""
+    group_by: List[str] = Field(default_factory=list)
+    filters: List[AnalyticsFilter] = Field(default_factory=list)
+    metrics: List[AnalyticsMetric] = Field(..., min_length=1)
+    order_by: Optional[str] = None
+    descending: bool = True
+    limit: Optional[int] = Field(None, gt=0)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
 from datetime import datetime
+from typing import Optional
 
 class InkFillCreate(BaseModel):
     """
@@ -8,6 +9,11 @@ class InkFillCreate(BaseModel):
     """
     color: str = Field(..., description="The color of ink being filled, e.g., 'Cyan'")
     amount_litters: float = Field(..., gt=0, description="The amount of ink in liters")
+    idempotency_key: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Client-chosen key that makes retried uploads of the same fill a no-op"
+    )
 
 class InkFillRecord(InkFillCreate):
     owner_email: EmailStr
@@ -31,5 +31,12 @@ class PrintJob(BaseModel):
     speed: str
     printed_pass: int
 
+    # Deduplication
+    idempotency_key: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Client-chosen key that makes retried uploads of the same job a no-op"
+    )
+
     class Config:
         str_strip_whitespace = True
\ No newline at end of file
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from typing import Annotated
+
+from backend.models.analytics_model import AnalyticsQuery
+from backend.utils.analytics import CATEGORICAL_FIELDS, NUMERIC_FIELDS, AnalyticsQueryError
+from backend.utils.auth import get_current_user
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+@router.get("/fields", response_description="List the fields available to analytics queries")
+async def list_analytics_fields(
+    current_user: Annotated[str, Depends(get_current_user)]
+):
+    return {"numeric": list(NUMERIC_FIELDS), "categorical": list(CATEGORICAL_FIELDS)}
+
+@router.post("/query", response_description="Run a group-by query over the user's jobs")
+async def run_analytics_query(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    query: AnalyticsQuery = Body(...)
+):
+    """
+    Filters, groups and aggregates the user's print jobs from the in-memory
+    column store. The first query for a user loads their jobs from MongoDB;
+    later queries only read jobs added since. The query itself runs in a
+    worker thread on a snapshot of the table, so it never stalls the loop.
+    """
+    table = await request.app.analytics.table(request.app.db, current_user)
+    try:
+        rows = await run_in_threadpool(table.snapshot().query, query)
+    except AnalyticsQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_count": table.size, "rows": rows}
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.encoders import jsonable_encoder # <-- 1. IMPORT THIS
+from starlette.concurrency import run_in_threadpool
 from typing import Annotated
 
 from backend.models.user_model import UserCreate, Token, UserInDB
@@ -19,7 +20,8 @@ async def register_user(request: Request, user_data: UserCreate):
             detail="Email already registered",
         )
     
-    hashed_password = get_password_hash(user_data.password)
+    # bcrypt is deliberately slow; keep it off the event loop.
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     user_in_db = UserInDB(email=user_data.email, hashed_password=hashed_password)
     
     # <-- 2. USE jsonable_encoder HERE instead of .dict()
@@ -36,7 +38,7 @@ async def login_for_access_token(request: Request, form_data: Annotated[OAuth2Pa
     user_collection = request.app.db["users"]
     user = await user_collection.find_one({"email": form_data.username})
 
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -0,0 +1,264 @@
+import csv
+import io
+from datetime import datetime
+from typing import Annotated, Literal, Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from backend.utils.auth import get_current_user
+from backend.utils.dates import as_datetime, date_range
+from backend.utils import job_store
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+# Documents pulled from the server per round trip. Rows are written out
+# batch by batch so memory stays flat no matter how big the export is.
+EXPORT_BATCH_SIZE = 5000
+
+JOB_COLUMNS = [
+    "id", "printer_id", "job_name", "job_status", "copies", "print_date",
+    "width_mm", "length_mm", "printed_area_sqm", "printed_length_m", "total_ink_ml",
+    "dpi_x", "dpi_y", "print_mode", "speed", "printed_pass",
+]
+
+# Catch-all for ink channels a job reports that its printer no longer lists
+# (re-plumbed or renamed inks), so the ink columns always add up to
+# total_ink_ml.
+OTHER_INK_COLUMN = "ink_other_ml"
+
+INK_FILL_COLUMNS = ["id", "printer_id", "color", "amount_liters", "timestamp"]
+
+# --- Helper Functions ---
+
+def _ink_fill_query(owner_email: str, printer_id: Optional[str],
+                    start: Optional[datetime], end: Optional[datetime]) -> dict:
+    clauses = [{"owner_email": owner_email}]
+    if printer_id:
+        clauses.append({"$or": [{"printer_id": printer_id}, {"printer_id": ObjectId(printer_id)}]})
+    date_clause = date_range("timestamp", start, end)
+    if date_clause:
+        clauses.append(date_clause)
+    return {"$and": clauses} if len(clauses) > 1 else clauses[0]
+
+def _ink_column(color: str) -> str:
+    return f"ink_{color.strip().lower().replace(' ', '_')}_ml"
+
+def _ink_columns(colors: list) -> list:
+    return [_ink_column(color) for color in colors] + [OTHER_INK_COLUMN]
+
+async def _ink_colors(db, owner_email: str, printer_id: Optional[str]) -> list:
+    """
+    Collects the ink channels of the exported printers, in the order they are
+    configured. These become the fixed per-color columns of the job export,
+    so the job stream itself only has to be read once; anything else a job
+    reports lands in OTHER_INK_COLUMN.
+    """
+    query = {"owner_email": owner_email}
+    if printer_id:
+        query["_id"] = ObjectId(printer_id)
+    colors = {}
+    async for printer in db["printers"].find(query, {"inks": 1}):
+        for ink in printer.get("inks", []):
+            colors.setdefault(ink.lower(), ink)
+    return list(colors.values())
+
+def _job_row(job: dict, colors: list) -> list:
+    job = job_store.decode_job(job)
+    consumption = {}
+    for color, amount in (job.get("ink_consumption_ml") or {}).items():
+        if amount is not None:
+            consumption[color.lower()] = consumption.get(color.lower(), 0) + amount
+    known = {color.lower() for color in colors}
+    other = [amount for color, amount in consumption.items() if color not in known]
+    return [
+        str(job["_id"]),
+        str(job.get("printer_id")),
+        job.get("job_name"),
+        job.get("job_status"),
+        job.get("copies", 1),
+        as_datetime(job.get("print_date")),
+        job.get("width_mm"),
+        job.get("length_mm"),
+        job.get("printed_area_sqm"),
+        job.get("printed_length_m"),
+        job.get("total_ink_ml"),
+        job.get("dpi_x"),
+        job.get("dpi_y"),
+        job.get("print_mode"),
+        job.get("speed"),
+        job.get("printed_pass"),
+    ] + [consumption.get(color.lower()) for color in colors] + [sum(other) if other else None]
+
+def _ink_fill_row(fill: dict, colors: list) -> list:
+    return [
+        str(fill["_id"]),
+        str(fill.get("printer_id")),
+        fill.get("color"),
+        fill.get("amount_liters", fill.get("amount_litters")),
+        as_datetime(fill.get("timestamp")),
+    ]
+
+async def _row_batches(cursor, to_row, colors: list, prepare=None):
+    """
+    Yields lists of at most EXPORT_BATCH_SIZE rows straight off the cursor.
+    `prepare` is awaited with each batch of documents before they become rows.
+    """
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            if prepare:
+                await prepare(batch)
+            yield [to_row(doc, colors) for doc in batch]
+            batch = []
+    if batch:
+        if prepare:
+            await prepare(batch)
+        yield [to_row(doc, colors) for doc in batch]
+
+# --- Encoders ---
+
+async def _stream_csv(batches, header: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in batch
+        )
+        yield buffer.getvalue()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only sink that hands finished Parquet bytes back to the response."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+async def _stream_parquet(batches, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        async for batch in batches:
+            columns = list(zip(*batch))
+            table = pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+            # Each batch becomes one row group; encoding it is CPU bound.
+            await run_in_threadpool(writer.write_table, table)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def _parquet_schema(kind: str, colors: list):
+    import pyarrow as pa
+
+    if kind == "ink_fills":
+        return pa.schema([
+            ("id", pa.string()), ("printer_id", pa.string()), ("color", pa.string()),
+            ("amount_liters", pa.float64()), ("timestamp", pa.timestamp("us")),
+        ])
+    return pa.schema([
+        ("id", pa.string()), ("printer_id", pa.string()), ("job_name", pa.string()),
+        ("job_status", pa.string()), ("copies", pa.int64()), ("print_date", pa.timestamp("us")),
+        ("width_mm", pa.float64()), ("length_mm", pa.float64()),
+        ("printed_area_sqm", pa.float64()), ("printed_length_m", pa.float64()),
+        ("total_ink_ml", pa.float64()), ("dpi_x", pa.int64()), ("dpi_y", pa.int64()),
+        ("print_mode", pa.string()), ("speed", pa.string()), ("printed_pass", pa.int64()),
+    ] + [(column, pa.float64()) for column in _ink_columns(colors)])
+
+def _export_response(kind: str, export_format: str, batches, header: list, colors: list):
+    stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    if export_format == "parquet":
+        try:
+            schema = _parquet_schema(kind, colors)
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet export requires pyarrow to be installed on the server."
+            )
+        body, media_type = _stream_parquet(batches, schema), "application/vnd.apache.parquet"
+    else:
+        body, media_type = _stream_csv(batches, header), "text/csv"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}_{stamp}.{export_format}"'},
+    )
+
+# --- Export Endpoints ---
+
+@router.get("/jobs", response_description="Stream print jobs as CSV or Parquet")
+async def export_jobs(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    format: Literal["csv", "parquet"] = "csv",
+    printer_id: Optional[str] = None,
+    start_date: Optional[datetime] = Query(None, description="Inclusive lower bound on print_date"),
+    end_date: Optional[datetime] = Query(None, description="Exclusive upper bound on print_date"),
+):
+    """
+    Streams the user's print jobs, one row per job, with `ink_consumption_ml`
+    flattened into one `ink_<color>_ml` column per ink channel of the printers
+    plus `ink_other_ml` for channels they no longer list.
+    """
+    if printer_id and not ObjectId.is_valid(printer_id):
+        raise HTTPException(status_code=400, detail=f"Invalid printer ID: {printer_id}")
+
+    db = request.app.db
+    colors = await _ink_colors(db, current_user, printer_id)
+    query = await job_store.job_query(db, current_user, printer_id, start_date, end_date)
+    cursor = job_store.collection(db).find(query).sort(job_store.field("print_date"), 1).batch_size(EXPORT_BATCH_SIZE)
+
+    async def prime(docs):
+        await job_store.prime(db, docs)
+
+    header = JOB_COLUMNS + _ink_columns(colors)
+    return _export_response("jobs", format, _row_batches(cursor, _job_row, colors, prime), header, colors)
+
+
+@router.get("/ink-fills", response_description="Stream ink fill records as CSV or Parquet")
+async def export_ink_fills(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    format: Literal["csv", "parquet"] = "csv",
+    printer_id: Optional[str] = None,
+    start_date: Optional[datetime] = Query(None, description="Inclusive lower bound on timestamp"),
+    end_date: Optional[datetime] = Query(None, description="Exclusive upper bound on timestamp"),
+):
+    """
+    Streams the user's ink fill records, one row per fill event.
+    """
+    if printer_id and not ObjectId.is_valid(printer_id):
+        raise HTTPException(status_code=400, detail=f"Invalid printer ID: {printer_id}")
+
+    query = _ink_fill_query(current_user, printer_id, start_date, end_date)
+    cursor = request.app.db["ink_fills"].find(query).sort("timestamp", 1).batch_size(EXPORT_BATCH_SIZE)
+
+    return _export_response("ink_fills", format, _row_batches(cursor, _ink_fill_row, []), INK_FILL_COLUMNS, [])
@@ -3,9 +3,10 @@
 from fastapi import APIRouter, Depends, Request
 from typing import Annotated, List
 from backend.utils.auth import get_current_user
+from backend.utils.fields import FieldsQuery, parse_fields, select
 
 # We need the helper function from the printers router
-from backend.routers.printers import ink_fill_helper
+from backend.routers.printers import ink_fill_helper, ink_fill_projection, INK_FILL_FIELDS
 
 router = APIRouter(prefix="/ink-fills", tags=["Ink Fills"])
 
@@ -15,16 +16,18 @@ router = APIRouter(prefix="/ink-fills", tags=["Ink Fills"])
 )
 async def get_all_ink_fills(
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None
 ):
     """
     Retrieves all ink fill records for the currently authenticated user.
     """
+    fields = parse_fields(fields, INK_FILL_FIELDS)
     fills = []
     query = {"owner_email": current_user}
     
     # Sort by timestamp, most recent first
-    async for fill in request.app.db["ink_fills"].find(query).sort("timestamp", -1):
-        fills.append(ink_fill_helper(fill))
+    async for fill in request.app.db["ink_fills"].find(query, ink_fill_projection(fields)).sort("timestamp", -1):
+        fills.append(select(ink_fill_helper(fill), fields))
         
     return fills
\ No newline at end of file
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, Request, Body, HTTPException, status
-from typing import Annotated, List
+from typing import Annotated
 from bson import ObjectId
 from fastapi.encoders import jsonable_encoder
 
 from backend.models.inventory_model import InkInventoryCreate, InkInventoryUpdate, InkInventoryResponse
 from backend.utils.auth import get_current_user
+from backend.utils.fields import FieldsQuery, parse_fields, projection, select
 
 router = APIRouter(prefix="/inventory", tags=["Ink Inventory"])
 
+INVENTORY_FIELDS = ("id", "owner_email", "ink_name", "unit_volume_ml", "stock_on_hand")
+
 def inventory_helper(item) -> dict:
     """Converts an inventory item doc from MongoDB to a JSON-serializable dict."""
     return {
@@ -46,17 +49,18 @@ async def create_inventory_item(
 
 @router.get(
     "/", 
-    response_description="List all ink inventory items", 
-    response_model=List[InkInventoryResponse]
+    response_description="List all ink inventory items"
 )
 async def list_inventory_items(
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None
 ):
+    fields = parse_fields(fields, INVENTORY_FIELDS)
     collection = request.app.db["ink_inventory"]
     items = []
-    async for item in collection.find({"owner_email": current_user}):
-        items.append(inventory_helper(item))
+    async for item in collection.find({"owner_email": current_user}, projection(fields)):
+        items.append(select(inventory_helper(item), fields))
     return items
 
 @router.put(
@@ -1,15 +1,31 @@
-from fastapi import APIRouter, HTTPException, Body, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Body, Request, Response, Depends, status
 from typing import List, Annotated
 from bson import ObjectId
 from fastapi.encoders import jsonable_encoder
 
 from backend.models.job_model import PrintJob
 from backend.utils.auth import get_current_user
+from backend.utils import job_store
+from backend.utils.anomaly import observe_jobs
+from backend.utils import idempotency
+from backend.utils.fields import FieldsQuery, ExpandQuery, parse_fields, parse_expand, select
+from backend.routers.printers import expand_printers
 
 router = APIRouter(prefix="/jobs", tags=["Jobs"])
 
+# Upper bound on jobs per POST /jobs/batch request.
+MAX_BATCH_SIZE = 1000
+
+JOB_FIELDS = (
+    "id", "printer_id", "owner_email", "job_name", "job_status", "copies", "print_date",
+    "width_mm", "length_mm", "printed_area_sqm", "printed_length_m", "total_ink_ml",
+    "ink_consumption_ml", "dpi_x", "dpi_y", "print_mode", "speed", "printed_pass",
+)
+
 def job_helper(job) -> dict:
     """Converts a job document from MongoDB to a JSON-serializable dict."""
+    job = job_store.decode_job(job)
+    print_date = job.get("print_date")
     return {
         "id": str(job["_id"]),
         "printer_id": str(job.get("printer_id")),
@@ -17,7 +33,7 @@ def job_helper(job) -> dict:
         "job_name": job.get("job_name"),
         "job_status": job.get("job_status"),
         "copies": job.get("copies", 1),
-        "print_date": job.get("print_date").isoformat() if job.get("print_date") else None,
+        "print_date": print_date.isoformat() if hasattr(print_date, "isoformat") else print_date,
         "width_mm": job.get("width_mm"),
         "length_mm": job.get("length_mm"),
         "printed_area_sqm": job.get("printed_area_sqm"),
@@ -31,6 +47,132 @@ def job_helper(job) -> dict:
         "printed_pass": job.get("printed_pass"),
     }
 
+async def ingest_jobs(request: Request, current_user: str, jobs: List[PrintJob]) -> List[dict]:
+    """
+    Stores a list of uploaded jobs, skipping ones already stored.
+
+    Every job has an idempotency key, either sent by the agent or derived from
+    printer_id, job_name, print_date and copies. Keys are claimed in job_keys
+    before the jobs are inserted. A key claimed by an earlier upload whose job
+    is stored makes the job a duplicate, and the original job_id is returned
+    for it instead. Returns one {"job_id", "duplicate"} per job, in order.
+    """
+    db = request.app.db
+    job_dicts = []
+    for job_data in jobs:
+        job_dict = jsonable_encoder(job_data)
+        if current_user:
+            job_dict["owner_email"] = current_user
+
+        # Check if printer_id is a valid ObjectId before proceeding
+        if not ObjectId.is_valid(job_dict["printer_id"]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid printer_id format: {job_dict['printer_id']}"
+            )
+        job_dict["idempotency_key"] = job_dict.get("idempotency_key") or idempotency.derive_key(job_dict)
+        job_dicts.append(job_dict)
+
+    owners = {job_dict["owner_email"] for job_dict in job_dicts}
+    printer_ids = {job_dict["printer_id"] for job_dict in job_dicts}
+    printers = {}
+    async for printer in db["printers"].find({
+        "_id": {"$in": [ObjectId(pid) for pid in printer_ids]},
+        "owner_email": {"$in": list(owners)}
+    }):
+        printers[(str(printer["_id"]), printer["owner_email"])] = printer
+    for job_dict in job_dicts:
+        if (job_dict["printer_id"], job_dict["owner_email"]) not in printers:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Printer not found or user does not have permission."
+            )
+
+    # One key per job; a key repeated inside the batch maps to its first job.
+    job_ids = {}
+    for job_dict in job_dicts:
+        job_ids.setdefault((job_dict["owner_email"], job_dict["idempotency_key"]), ObjectId())
+
+    existing, fresh = {}, {}
+    for owner in owners:
+        claims = [(key, job_id) for (o, key), job_id in job_ids.items() if o == owner]
+        found = await idempotency.claim_keys(db, owner, claims)
+        fresh[owner] = [(key, job_id) for key, job_id in claims if key not in found]
+        for key, claim in found.items():
+            existing[(owner, key)] = claim
+            job_ids[(owner, key)] = claim["job_id"]
+
+    # Only a claim whose job is stored makes a duplicate. A claim without its
+    # job was left by an upload that failed between claiming and inserting
+    # (error, deadline, disconnect): past the grace period, finish that upload
+    # under the original job_id. A younger one may still be in flight, so the
+    # client has to retry rather than be told the job is stored.
+    stored = set()
+    claimed = [claim["job_id"] for claim in existing.values()]
+    if claimed:
+        async for doc in job_store.collection(db).find({"_id": {"$in": claimed}}, {"_id": 1}):
+            stored.add(doc["_id"])
+    in_flight = [
+        claim for claim in existing.values()
+        if claim["job_id"] not in stored and not idempotency.is_abandoned(claim)
+    ]
+    if in_flight:
+        for owner, claims in fresh.items():
+            await idempotency.release_keys(db, owner, claims)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="An earlier upload of the same job is still in progress; retry shortly.",
+            headers={"Retry-After": str(int(idempotency.CLAIM_GRACE.total_seconds()))},
+        )
+
+    results, new_jobs, seen = [], [], set()
+    for job_dict in job_dicts:
+        ident = (job_dict["owner_email"], job_dict["idempotency_key"])
+        job_id = job_ids[ident]
+        duplicate = ident in seen or job_id in stored
+        if not duplicate:
+            new_jobs.append((job_id, job_dict))
+        seen.add(ident)
+        results.append({"job_id": str(job_id), "duplicate": duplicate})
+
+    if new_jobs:
+        docs = []
+        for job_id, job_dict in new_jobs:
+            printer = printers[(job_dict["printer_id"], job_dict["owner_email"])]
+            doc = await job_store.encode_job(
+                db, {k: v for k, v in job_dict.items() if k != "idempotency_key"}, printer.get("inks", [])
+            )
+            doc["_id"] = job_id
+            docs.append(doc)
+        # If this fails the claims stay behind and a retry finishes the upload.
+        await job_store.collection(db).insert_many(docs, ordered=False)
+
+    for job_id, job_dict in new_jobs:
+        printer = printers[(job_dict["printer_id"], job_dict["owner_email"])]
+        request.app.analytics.append_job(job_dict["owner_email"], job_id, job_dict, printer)
+    for owner in owners:
+        await observe_jobs(db, owner, [
+            (job_dict["printer_id"], job_id, job_dict)
+            for job_id, job_dict in new_jobs if job_dict["owner_email"] == owner
+        ])
+
+    return results
+
+def _job_projection(fields, expand):
+    """Projection for `fields=`; expanding the printer needs printer_id even if not requested."""
+    if fields is None:
+        return None
+    return job_store.projection(
+        name for name in [*fields, *(["printer_id"] if "printer" in expand else [])] if name != "id"
+    )
+
+async def _shape_jobs(request: Request, current_user: str, docs: list, fields, expand) -> list:
+    await job_store.prime(request.app.db, docs)
+    jobs = [job_helper(doc) for doc in docs]
+    if "printer" in expand:
+        await expand_printers(request.app.db, current_user, jobs)
+    return [select(job, fields, extra=expand) for job in jobs]
+
 @router.post(
     "/", 
     response_description="Upload a new print job", 
@@ -39,34 +181,39 @@ def job_helper(job) -> dict:
 )
 async def upload_print_job(
     request: Request,
+    response: Response,
     job_data: PrintJob = Body(...),
     current_user: Annotated[str, Depends(get_current_user)] = None
 ):
-    job_collection = request.app.db["print_jobs"]
-    job_dict = jsonable_encoder(job_data)
-    
-    if current_user:
-        job_dict["owner_email"] = current_user
-    
-    # Check if printer_id is a valid ObjectId before proceeding
-    if not ObjectId.is_valid(job_dict["printer_id"]):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid printer_id format: {job_dict['printer_id']}"
-        )
+    [result] = await ingest_jobs(request, current_user, [job_data])
+    if result["duplicate"]:
+        # A retry of a job that is already stored: nothing was created.
+        response.status_code = status.HTTP_200_OK
+        return {"message": "Job already uploaded", **result}
+    return {"message": "Job uploaded successfully", **result}
 
-    printer = await request.app.db["printers"].find_one({
-        "_id": ObjectId(job_dict["printer_id"]),
-        "owner_email": job_dict["owner_email"]
-    })
-    if not printer:
+@router.post(
+    "/batch", 
+    response_description="Upload several print jobs at once", 
+    status_code=status.HTTP_201_CREATED,
+    response_model=dict
+)
+async def upload_print_jobs_batch(
+    request: Request,
+    jobs: List[PrintJob] = Body(...),
+    current_user: Annotated[str, Depends(get_current_user)] = None
+):
+    if not 0 < len(jobs) <= MAX_BATCH_SIZE:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Printer not found or user does not have permission."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch must contain between 1 and {MAX_BATCH_SIZE} jobs."
         )
-
-    new_job = await job_collection.insert_one(job_dict)
-    return {"message": "Job uploaded successfully", "job_id": str(new_job.inserted_id)}
+    results = await ingest_jobs(request, current_user, jobs)
+    duplicates = sum(result["duplicate"] for result in results)
+    return {
+        "message": f"{len(results) - duplicates} jobs uploaded, {duplicates} duplicates skipped",
+        "results": results,
+    }
 
 @router.get(
     "/by_printer/{printer_id}", 
@@ -75,63 +222,69 @@ async def upload_print_job(
 async def get_jobs_for_printer(
     printer_id: str,
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
 ):
     if not ObjectId.is_valid(printer_id):
         raise HTTPException(status_code=400, detail="Invalid printer ID")
+    fields = parse_fields(fields, JOB_FIELDS)
+    expand = parse_expand(expand, {"printer"})
     
-    job_collection = request.app.db["print_jobs"]
-    jobs = []
+    job_collection = job_store.collection(request.app.db)
+    docs = []
     
-    # --- THIS IS THE FIX ---
-    # We create a query that checks for the printer_id as a STRING
-    # and *also* as an ObjectId, just in case.
-    # This makes the query robust to how the data was stored.
-    query = {
-        "owner_email": current_user,
-        "$or": [
-            {"printer_id": printer_id},
-            {"printer_id": ObjectId(printer_id)}
-        ]
-    }
-    # --- END FIX ---
+    # job_store matches printer_id however it was stored (string or ObjectId)
+    query = await job_store.job_query(request.app.db, current_user, printer_id=printer_id)
     
     # Find jobs matching the query, sorted by print_date descending
-    async for job in job_collection.find(query).sort("print_date", -1):
-        jobs.append(job_helper(job))
+    cursor = job_collection.find(query, _job_projection(fields, expand)).sort(job_store.field("print_date"), -1)
+    async for job in cursor:
+        docs.append(job)
         
-    return jobs
+    return await _shape_jobs(request, current_user, docs, fields, expand)
 
 @router.get("/{job_id}", response_description="Get a single job by ID")
 async def get_job_by_id(
     job_id: str,
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
 ):
     if not ObjectId.is_valid(job_id):
         raise HTTPException(status_code=400, detail="Invalid job ID")
+    fields = parse_fields(fields, JOB_FIELDS)
+    expand = parse_expand(expand, {"printer"})
     
-    job_collection = request.app.db["print_jobs"]
+    job_collection = job_store.collection(request.app.db)
     
     job = await job_collection.find_one({
         "_id": ObjectId(job_id),
-        "owner_email": current_user
-    })
+        **await job_store.job_query(request.app.db, current_user)
+    }, _job_projection(fields, expand))
     
     if job:
-        return job_helper(job)
+        [shaped] = await _shape_jobs(request, current_user, [job], fields, expand)
+        return shaped
         
     raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
 
 @router.get("/", response_description="Get all jobs for the user")
 async def get_all_jobs(
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
 ):
-    job_collection = request.app.db["print_jobs"]
-    jobs = []
+    fields = parse_fields(fields, JOB_FIELDS)
+    expand = parse_expand(expand, {"printer"})
+    job_collection = job_store.collection(request.app.db)
+    docs = []
     
-    async for job in job_collection.find({"owner_email": current_user}).sort("print_date", -1):
-        jobs.append(job_helper(job))
+    query = await job_store.job_query(request.app.db, current_user)
+    cursor = job_collection.find(query, _job_projection(fields, expand)).sort(job_store.field("print_date"), -1)
+    async for job in cursor:
+        docs.append(job)
         
-    return jobs
\ No newline at end of file
+    return await _shape_jobs(request, current_user, docs, fields, expand)
\ No newline at end of file
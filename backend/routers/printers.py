@@ -1,15 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Body, Request, Depends
+from fastapi import APIRouter, HTTPException, status, Body, Query, Request, Response, Depends
 from typing import List, Annotated
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from fastapi.encoders import jsonable_encoder
 
 from backend.models.printer_model import Printer
 from backend.utils.auth import get_current_user
 from backend.models.ink_fill_model import InkFillCreate, InkFillRecord
+from backend.utils.anomaly import ANOMALIES_COLLECTION
+from backend.utils import idempotency, job_store, task_queue
+from backend.utils.cleanup import CLEANUP_ORPHANS
+from backend.utils.fields import FieldsQuery, ExpandQuery, parse_fields, parse_expand, projection, select
+from backend.routers.inventory import inventory_helper
 
 router = APIRouter(prefix="/printers", tags=["Printers"])
 
+# Fields of printer_helper; GET /printers/{id} also accepts any stored field.
+PRINTER_FIELDS = (
+    "id", "owner_email", "printer_name", "brand", "model", "serial_number",
+    "location", "status", "inks", "ink_costs", "ink_link",
+)
+OVERVIEW_FIELDS = PRINTER_FIELDS + ("activity", "last_ink_fill")
+INK_FILL_FIELDS = ("id", "color", "amount_liters", "owner_email", "printer_id", "timestamp")
+
 # --- Helper Functions ---
 
 def printer_helper(printer) -> dict:
@@ -36,12 +49,68 @@ def ink_fill_helper(fill) -> dict:
     return {
         "id": str(fill["_id"]),
         "color": fill.get("color"),
-        "amount_liters": fill.get("amount_liters"),
+        "amount_liters": fill.get("amount_liters", fill.get("amount_litters")),
         "owner_email": fill.get("owner_email"),
         "printer_id": str(fill.get("printer_id")),
         "timestamp": fill.get("timestamp").isoformat() if fill.get("timestamp") else None,
     }
 
+def ink_fill_projection(fields):
+    # Older fills stored the amount as amount_litters.
+    if fields is not None and "amount_liters" in fields:
+        return projection(fields, ["amount_litters"])
+    return projection(fields)
+
+def anomaly_helper(anomaly) -> dict:
+    """Converts a job_anomalies document to a JSON-serializable dict."""
+    print_date = anomaly.get("print_date")
+    return {
+        "id": str(anomaly["_id"]),
+        "printer_id": anomaly.get("printer_id"),
+        "job_id": anomaly.get("job_id"),
+        "job_name": anomaly.get("job_name"),
+        "print_mode": anomaly.get("print_mode"),
+        "print_date": print_date.isoformat() if hasattr(print_date, "isoformat") else print_date,
+        "metrics": anomaly.get("metrics", []),
+        "detected_at": anomaly.get("detected_at").isoformat() if anomaly.get("detected_at") else None,
+    }
+
+async def expand_printers(db, owner_email: str, items: List[dict]) -> None:
+    """Attaches printer_helper output under "printer" to each item, with one query for all of them."""
+    ids = {item["printer_id"] for item in items if ObjectId.is_valid(item.get("printer_id") or "")}
+    printers = {}
+    async for printer in db["printers"].find({
+        "_id": {"$in": [ObjectId(pid) for pid in ids]},
+        "owner_email": owner_email
+    }):
+        printers[str(printer["_id"])] = printer_helper(printer)
+    for item in items:
+        item["printer"] = printers.get(item.get("printer_id"))
+
+def expanded_fields(expand: set) -> list:
+    """Fields an expansion fills in; they are returned even when `fields=` leaves them out."""
+    return ["ink_link"] if "inventory" in expand else []
+
+async def expand_inventory(db, owner_email: str, printers: List[dict]) -> None:
+    """Replaces the inventory ids in each printer's ink_link with the inventory items themselves."""
+    ids = {
+        str(item_id) for printer in printers
+        for item_id in (printer.get("ink_link") or {}).values()
+        if item_id and ObjectId.is_valid(str(item_id))
+    }
+    items = {}
+    async for item in db["ink_inventory"].find({
+        "_id": {"$in": [ObjectId(item_id) for item_id in ids]},
+        "owner_email": owner_email
+    }):
+        items[str(item["_id"])] = inventory_helper(item)
+    for printer in printers:
+        if printer.get("ink_link"):
+            printer["ink_link"] = {
+                color: items.get(str(item_id)) if item_id else None
+                for color, item_id in printer["ink_link"].items()
+            }
+
 # --- Printer CRUD Endpoints ---
 
 @router.post("/", response_description="Register a new printer", status_code=status.HTTP_201_CREATED)
@@ -70,33 +139,145 @@ async def register_printer(
 @router.get("/", response_description="List all of your printers")
 async def list_all_printers(
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
 ):
+    fields = parse_fields(fields, PRINTER_FIELDS)
+    expand = parse_expand(expand, {"inventory"})
     printers = []
-    async for printer in request.app.db["printers"].find({"owner_email": current_user}):
+    cursor = request.app.db["printers"].find(
+        {"owner_email": current_user},
+        projection(fields, expanded_fields(expand))
+    )
+    async for printer in cursor:
         printers.append( printer_helper(printer) )
-    return printers
+    if "inventory" in expand:
+        await expand_inventory(request.app.db, current_user, printers)
+    return [select(printer, fields, extra=expanded_fields(expand)) for printer in printers]
+
+
+def _window_sum(value, since: datetime) -> dict:
+    return {"$sum": {"$cond": [{"$gte": ["$print_date", since]}, value, 0]}}
+
+@router.get("/overview", response_description="List printers with their recent activity")
+async def get_fleet_overview(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
+):
+    """
+    Every printer of the user plus its job activity and last ink fill,
+    computed in one aggregation. Each printer joins only its own jobs of the
+    last 30 days, its latest job and its latest fill, all through the
+    owner/printer/date indexes, so the cost does not grow with job history.
+    """
+    fields = parse_fields(fields, OVERVIEW_FIELDS)
+    expand = parse_expand(expand, {"inventory"})
+    now = datetime.utcnow()
+    since_7d, since_30d = now - timedelta(days=7), now - timedelta(days=30)
+
+    printer_jobs = {"$expr": {"$eq": [f"${job_store.field('printer_id')}", "$$pid"]}}
+    pipeline = [
+        {"$match": {"owner_email": current_user}},
+        {"$lookup": {
+            "from": job_store.PRINT_JOBS_COLLECTION,
+            "let": {"pid": job_store.printer_ref_expr("$_id")},
+            "pipeline": [
+                {"$match": {
+                    **await job_store.job_query(request.app.db, current_user, start=since_30d),
+                    **printer_jobs,
+                }},
+                {"$project": {
+                    "print_date": job_store.print_date_expr(),
+                    "copies": {"$ifNull": [f"${job_store.field('copies')}", 1]},
+                    "printed_area_sqm": f"${job_store.field('printed_area_sqm')}",
+                    "total_ink_ml": f"${job_store.field('total_ink_ml')}",
+                }},
+                {"$group": {
+                    "_id": None,
+                    "jobs_7d": _window_sum(1, since_7d),
+                    "jobs_30d": _window_sum(1, since_30d),
+                    "copies_30d": _window_sum("$copies", since_30d),
+                    "area_sqm_7d": _window_sum("$printed_area_sqm", since_7d),
+                    "area_sqm_30d": _window_sum("$printed_area_sqm", since_30d),
+                    "ink_ml_7d": _window_sum("$total_ink_ml", since_7d),
+                    "ink_ml_30d": _window_sum("$total_ink_ml", since_30d),
+                }},
+            ],
+            "as": "job_activity",
+        }},
+        {"$lookup": {
+            "from": job_store.PRINT_JOBS_COLLECTION,
+            "let": {"pid": job_store.printer_ref_expr("$_id")},
+            "pipeline": [
+                {"$match": {**await job_store.job_query(request.app.db, current_user), **printer_jobs}},
+                # Plain collections may hold print_date as strings from some
+                # writers and BSON dates from others; those sort apart.
+                {"$sort": {job_store.field("print_date"): -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "print_date": job_store.print_date_expr()}},
+            ],
+            "as": "last_job",
+        }},
+        {"$lookup": {
+            "from": "ink_fills",
+            "let": {"pid": {"$toString": "$_id"}},
+            "pipeline": [
+                {"$match": {"owner_email": current_user, "$expr": {"$eq": ["$printer_id", "$$pid"]}}},
+                {"$sort": {"timestamp": -1}},
+                {"$limit": 1},
+            ],
+            "as": "last_ink_fill",
+        }},
+    ]
+
+    overview = []
+    async for printer in request.app.db["printers"].aggregate(pipeline):
+        activity = printer["job_activity"][0] if printer["job_activity"] else {}
+        activity.pop("_id", None)
+        last_job_at = printer["last_job"][0]["print_date"] if printer["last_job"] else None
+        overview.append({
+            **printer_helper(printer),
+            "activity": {
+                "last_job_at": last_job_at.isoformat() if last_job_at else None,
+                **{key: activity.get(key, 0) for key in (
+                    "jobs_7d", "jobs_30d", "copies_30d", "area_sqm_7d", "area_sqm_30d", "ink_ml_7d", "ink_ml_30d"
+                )},
+            },
+            "last_ink_fill": ink_fill_helper(printer["last_ink_fill"][0]) if printer["last_ink_fill"] else None,
+        })
+    if "inventory" in expand:
+        await expand_inventory(request.app.db, current_user, overview)
+    return [select(printer, fields, extra=expanded_fields(expand)) for printer in overview]
 
 
 @router.get("/{id}", response_description="Get a single printer by ID")
 async def get_printer(
     id: str,
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None,
+    expand: ExpandQuery = None
 ):
     printer_collection = request.app.db["printers"]
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail=f"Invalid printer ID: {id}")
+    fields = parse_fields(fields, ("id", *Printer.model_fields))
+    expand = parse_expand(expand, {"inventory"})
 
     printer = await printer_collection.find_one({
         "_id": ObjectId(id), 
         "owner_email": current_user
-    })
+    }, projection(fields, expanded_fields(expand)))
     
     if printer:
         printer["id"] = str(printer["_id"])
         printer.pop("_id", None)
-        return printer
+        if "inventory" in expand:
+            await expand_inventory(request.app.db, current_user, [printer])
+        return select(printer, fields, extra=expanded_fields(expand))
         
     raise HTTPException(status_code=404, detail=f"Printer with ID {id} not found")
 
@@ -144,8 +325,14 @@ async def update_printer(
 async def delete_printer(
     id: str,
     request: Request,
+    response: Response,
     current_user: Annotated[str, Depends(get_current_user)]
 ):
+    """
+    Deletes the printer right away; its jobs, ink fills and anomaly
+    statistics are deleted by a background task whose id is returned in
+    the X-Task-Id header.
+    """
     printer_collection = request.app.db["printers"]
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail=f"Invalid printer ID: {id}")
@@ -155,8 +342,16 @@ async def delete_printer(
     if delete_result.deleted_count == 0:
         raise HTTPException(status_code=404, detail=f"Printer with ID {id} not found or you don't have permission")
 
+    request.app.analytics.drop_printer(current_user, id)
+    task_id = await task_queue.enqueue(request.app.db, current_user, CLEANUP_ORPHANS, {"printer_id": id})
+    response.headers["X-Task-Id"] = task_id
+
 # --- Ink Fill Endpoints ---
 
+async def ensure_indexes(db):
+    # Serves the per-printer fill listings and the overview's latest-fill lookup.
+    await db["ink_fills"].create_index([("owner_email", 1), ("printer_id", 1), ("timestamp", -1)])
+
 @router.post(
     "/{printer_id}/ink-fill", 
     response_description="Record a manual ink fill for a printer", 
@@ -165,9 +360,15 @@ async def delete_printer(
 async def record_ink_fill(
     printer_id: str,
     request: Request,
+    response: Response,
     ink_data: InkFillCreate,
     current_user: Annotated[str, Depends(get_current_user)]
 ):
+    """
+    Records a fill. A fill sent with an idempotency_key is stored once: a retry
+    with the same key returns the original record_id with a 200, the same way
+    job uploads are deduplicated. Fills without a key are stored every time.
+    """
     printer_collection = request.app.db["printers"]
     ink_fill_collection = request.app.db["ink_fills"]
     
@@ -199,12 +400,31 @@ async def record_ink_fill(
 
     ink_record = InkFillRecord(
         color=original_color,
-        amount_liters=ink_data.amount_liters,
+        amount_litters=ink_data.amount_litters,
         owner_email=current_user,
         printer_id=printer_id
     )
     
-    new_record = await ink_fill_collection.insert_one(ink_record.dict())
+    fill_doc = ink_record.dict(exclude={"idempotency_key"})
+    fill_doc["_id"] = ObjectId()
+
+    if ink_data.idempotency_key:
+        key = f"ink_fill:{ink_data.idempotency_key}"
+        claim = (await idempotency.claim_keys(request.app.db, current_user, [(key, fill_doc["_id"])])).get(key)
+        if claim is not None:
+            if await ink_fill_collection.find_one({"_id": claim["job_id"]}, {"_id": 1}):
+                response.status_code = status.HTTP_200_OK
+                return {"message": "Ink fill already recorded", "record_id": str(claim["job_id"])}
+            if not idempotency.is_abandoned(claim):
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="An earlier upload of the same fill is still in progress; retry shortly.",
+                    headers={"Retry-After": str(int(idempotency.CLAIM_GRACE.total_seconds()))},
+                )
+            # The earlier upload failed after claiming the key; finish it.
+            fill_doc["_id"] = claim["job_id"]
+
+    new_record = await ink_fill_collection.insert_one(fill_doc)
     
     return {
         "message": "Ink fill recorded successfully",
@@ -218,10 +438,12 @@ async def record_ink_fill(
 async def get_ink_fills_for_printer(
     printer_id: str,
     request: Request,
-    current_user: Annotated[str, Depends(get_current_user)]
+    current_user: Annotated[str, Depends(get_current_user)],
+    fields: FieldsQuery = None
 ):
     if not ObjectId.is_valid(printer_id):
         raise HTTPException(status_code=400, detail="Invalid printer ID")
+    fields = parse_fields(fields, INK_FILL_FIELDS)
 
     printer = await request.app.db["printers"].find_one({
         "_id": ObjectId(printer_id),
@@ -237,7 +459,33 @@ async def get_ink_fills_for_printer(
     fills = []
     query = {"owner_email": current_user, "printer_id": printer_id} 
     
-    async for fill in request.app.db["ink_fills"].find(query).sort("timestamp", -1):
-        fills.append(ink_fill_helper(fill))
+    async for fill in request.app.db["ink_fills"].find(query, ink_fill_projection(fields)).sort("timestamp", -1):
+        fills.append(select(ink_fill_helper(fill), fields))
         
-    return fills
\ No newline at end of file
+    return fills
+
+# --- Anomaly Endpoints ---
+
+@router.get(
+    "/{printer_id}/anomalies", 
+    response_description="Get jobs flagged for abnormal ink usage on a printer"
+)
+async def get_anomalies_for_printer(
+    printer_id: str,
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    limit: int = Query(100, gt=0, le=1000)
+):
+    """
+    Jobs whose ink per square meter deviated from the printer's running
+    statistics for the same print mode, most recent first.
+    """
+    if not ObjectId.is_valid(printer_id):
+        raise HTTPException(status_code=400, detail="Invalid printer ID")
+
+    query = {"owner_email": current_user, "printer_id": printer_id}
+    anomalies = []
+    async for anomaly in request.app.db[ANOMALIES_COLLECTION].find(query).sort("detected_at", -1).limit(limit):
+        anomalies.append(anomaly_helper(anomaly))
+
+    return anomalies
\ No newline at end of file
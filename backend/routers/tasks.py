@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from typing import Annotated, Optional
+from bson import ObjectId
+
+from backend.utils.auth import get_current_user
+from backend.utils import task_queue
+from backend.utils.cleanup import CLEANUP_ORPHANS
+
+router = APIRouter(prefix="/tasks", tags=["Tasks"])
+
+def task_helper(task) -> dict:
+    """Converts a task document to a JSON-serializable dict."""
+    return {
+        "id": str(task["_id"]),
+        "name": task.get("name"),
+        "params": task.get("params", {}),
+        "status": task.get("status"),
+        "attempts": task.get("attempts", 0),
+        "progress": task.get("progress"),
+        "result": task.get("result"),
+        "error": task.get("error"),
+        "created_at": task.get("created_at").isoformat() if task.get("created_at") else None,
+        "started_at": task.get("started_at").isoformat() if task.get("started_at") else None,
+        "finished_at": task.get("finished_at").isoformat() if task.get("finished_at") else None,
+    }
+
+@router.post(
+    "/cleanup-orphans",
+    response_description="Queue deletion of data left behind by deleted printers",
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def queue_orphan_cleanup(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    printer_id: Optional[str] = None
+):
+    """
+    Deletes the jobs, ink fills and anomaly statistics of deleted printers in
+    the background: one printer, or all of them when printer_id is omitted.
+    Poll GET /tasks/{id} for progress.
+    """
+    if printer_id and not ObjectId.is_valid(printer_id):
+        raise HTTPException(status_code=400, detail=f"Invalid printer ID: {printer_id}")
+    task_id = await task_queue.enqueue(
+        request.app.db, current_user, CLEANUP_ORPHANS, {"printer_id": printer_id}
+    )
+    return {"message": "Cleanup queued", "task_id": task_id}
+
+@router.get("/", response_description="List your recent background tasks")
+async def list_tasks(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)],
+    limit: int = Query(50, gt=0, le=1000)
+):
+    tasks = []
+    cursor = request.app.db[task_queue.TASKS_COLLECTION].find(
+        {"owner_email": current_user}
+    ).sort("created_at", -1).limit(limit)
+    async for task in cursor:
+        tasks.append(task_helper(task))
+    return tasks
+
+@router.get("/{task_id}", response_description="Get the status and progress of a background task")
+async def get_task(
+    task_id: str,
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user)]
+):
+    if not ObjectId.is_valid(task_id):
+        raise HTTPException(status_code=400, detail="Invalid task ID")
+
+    task = await request.app.db[task_queue.TASKS_COLLECTION].find_one({
+        "_id": ObjectId(task_id),
+        "owner_email": current_user
+    })
+    if task:
+        return task_helper(task)
+
+    raise HTTPException(status_code=404, detail=f"Task with ID {task_id} not found")
@@ -0,0 +1 @@
+#this is package file
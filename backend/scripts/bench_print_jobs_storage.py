@@ -0,0 +1,218 @@
+"""
+Compares storage size and query latency of print_jobs layouts.
+
+    python -m backend.scripts.bench_print_jobs_storage [--jobs N] [--tenants T] [--printers P]
+
+Generates the same synthetic jobs into a scratch database (DATABASE_NAME with
+a `_bench` suffix) once per layout (plain, time-series, compact codec), then
+reports collStats sizes (average document, uncompressed data, on-disk storage,
+indexes) and the median latency of the queries the routers issue. The scratch
+database is dropped afterwards unless --keep is given.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pymongo
+from bson import ObjectId
+
+from backend.utils.db import MONGO_URI, DATABASE_NAME
+from backend.utils import job_codec
+from backend.utils.job_store import META_FIELD, PRINT_JOBS_GRANULARITY
+from backend.scripts.migrate_print_jobs_timeseries import to_timeseries
+
+COLORS = ["Cyan", "Magenta", "Yellow", "Black", "Light Cyan", "Light Magenta", "White", "Varnish"]
+MODES = ["Production", "Quality", "High Quality", "Draft"]
+SPEEDS = ["Normal", "Fast", "Slow"]
+
+
+def synthetic_jobs(n_jobs: int, n_tenants: int, n_printers: int, seed: int = 7):
+    """Yields plain-layout job documents, as upload_print_job stores them."""
+    rng = random.Random(seed)
+    printers = [
+        (f"owner{t}@example.com", str(ObjectId()), COLORS[:rng.choice([4, 6, 8])])
+        for t in range(n_tenants) for _ in range(n_printers)
+    ]
+    start = datetime(2023, 1, 1)
+    for i in range(n_jobs):
+        owner, printer_id, inks = rng.choice(printers)
+        width, length = rng.uniform(300, 3200), rng.uniform(500, 20000)
+        area = width * length / 1e6
+        consumption = {ink: round(area * rng.uniform(0.5, 4), 3) for ink in inks}
+        yield {
+            "printer_id": printer_id,
+            "owner_email": owner,
+            "job_name": f"JOB-{i:08d}.tif",
+            "job_status": rng.choice(["Completed", "Completed", "Completed", "Cancelled"]),
+            "copies": rng.randint(1, 5),
+            "print_date": (start + timedelta(minutes=i * 525600 // max(n_jobs // 2, 1))).isoformat(),
+            "width_mm": round(width, 1),
+            "length_mm": round(length, 1),
+            "printed_area_sqm": round(area, 4),
+            "printed_length_m": round(length / 1000, 3),
+            "total_ink_ml": round(sum(consumption.values()), 3),
+            "ink_consumption_ml": consumption,
+            "dpi_x": rng.choice([360, 720, 1440]),
+            "dpi_y": rng.choice([360, 720, 1440]),
+            "print_mode": rng.choice(MODES),
+            "speed": rng.choice(SPEEDS),
+            "printed_pass": rng.choice([2, 4, 6, 8]),
+        }
+
+
+class Layout:
+    """How one storage layout creates its collection and phrases the router queries."""
+
+    name = "plain"
+    owner = "owner_email"
+    printer = "printer_id"
+    print_date = "print_date"
+    total_ink = "total_ink_ml"
+
+    def create(self, db, name):
+        return self.index(db.create_collection(name))
+
+    def index(self, coll):
+        """Same secondary indexes job_store.ensure_collection creates."""
+        coll.create_index([(self.owner, 1), (self.print_date, -1)])
+        coll.create_index([(self.owner, 1), (self.printer, 1), (self.print_date, -1)])
+        return coll
+
+    def encode(self, job):
+        return job
+
+    def date(self, value: datetime):
+        return value.isoformat()
+
+
+class TimeSeriesLayout(Layout):
+    name = "timeseries"
+    owner = f"{META_FIELD}.owner_email"
+    printer = f"{META_FIELD}.printer_id"
+
+    def create(self, db, name):
+        db.create_collection(
+            name,
+            timeseries={"timeField": "print_date", "metaField": META_FIELD, "granularity": PRINT_JOBS_GRANULARITY},
+        )
+        return self.index(db[name])
+
+    def encode(self, job):
+        return to_timeseries(job)
+
+    def date(self, value: datetime):
+        return value
+
+
+class CompactLayout(Layout):
+    """job_codec's encoding, with tenants and ink layouts interned in memory instead of in Mongo."""
+
+    name = "compact"
+    owner = job_codec.SHORT_KEYS["owner_email"]
+    printer = job_codec.SHORT_KEYS["printer_id"]
+    print_date = job_codec.SHORT_KEYS["print_date"]
+    total_ink = job_codec.SHORT_KEYS["total_ink_ml"]
+
+    def __init__(self):
+        self.tenants = {}
+        self.layouts = {}
+
+    def encode(self, job):
+        # synthetic_jobs lists each printer's inks in its configured order.
+        layout = tuple(job["ink_consumption_ml"])
+        tenant_id = self.tenants.setdefault(job["owner_email"], len(self.tenants) + 1)
+        layout_id = self.layouts.setdefault(layout, len(self.layouts) + 1)
+        return job_codec.pack(job, tenant_id, layout_id, layout)
+
+    def date(self, value: datetime):
+        return value
+
+
+LAYOUTS = [Layout(), TimeSeriesLayout(), CompactLayout()]
+
+
+def _path(doc: dict, path: str):
+    for key in path.split("."):
+        doc = doc[key]
+    return doc
+
+
+def load(coll, layout, args):
+    batch = []
+    for job in synthetic_jobs(args.jobs, args.tenants, args.printers):
+        batch.append(layout.encode(job))
+        if len(batch) >= 10000:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+
+
+def queries(coll, layout):
+    """The read paths of the routers: job lists, a printer's date window, a monthly rollup."""
+    sample = coll.find_one({}, {layout.owner: 1, layout.printer: 1})
+    owner, printer = _path(sample, layout.owner), _path(sample, layout.printer)
+    window_start = datetime(2023, 6, 1)
+    window_end = window_start + timedelta(days=30)
+    return {
+        "latest 100 jobs of a user": lambda: list(
+            coll.find({layout.owner: owner}).sort(layout.print_date, -1).limit(100)),
+        "printer jobs in 30 days": lambda: list(coll.find({
+            layout.owner: owner, layout.printer: printer,
+            layout.print_date: {"$gte": layout.date(window_start), "$lt": layout.date(window_end)},
+        })),
+        "ink per printer (aggregate)": lambda: list(coll.aggregate([
+            {"$match": {layout.owner: owner}},
+            {"$group": {"_id": f"${layout.printer}", "ink": {"$sum": f"${layout.total_ink}"}, "jobs": {"$sum": 1}}},
+        ])),
+    }
+
+
+def median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200000)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--printers", type=int, default=10, help="Printers per tenant")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(MONGO_URI)
+    db_name = f"{DATABASE_NAME}_bench"
+    client.drop_database(db_name)
+    db = client[db_name]
+
+    print(f"{args.jobs} jobs, {args.tenants} tenants x {args.printers} printers")
+    for layout in LAYOUTS:
+        name = f"print_jobs_{layout.name}"
+        coll = layout.create(db, name)
+        started = time.perf_counter()
+        load(coll, layout, args)
+        load_s = time.perf_counter() - started
+
+        stats = db.command("collStats", name)
+        print(f"\n[{layout.name}] load {load_s:.1f}s")
+        print(f"  avgObjSize     {stats.get('avgObjSize', 0):10.0f} B")
+        print(f"  size           {stats['size'] / 2**20:10.1f} MiB")
+        print(f"  storageSize    {stats['storageSize'] / 2**20:10.1f} MiB")
+        print(f"  totalIndexSize {stats['totalIndexSize'] / 2**20:10.1f} MiB")
+        for label, fn in queries(coll, layout).items():
+            print(f"  {label:30s} {median_ms(fn, args.repeats):8.2f} ms")
+
+    if not args.keep:
+        client.drop_database(db_name)
+
+
+if __name__ == "__main__":
+    main()
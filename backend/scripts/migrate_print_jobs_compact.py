@@ -0,0 +1,85 @@
+"""
+Re-encodes an existing plain print_jobs collection with the compact codec.
+
+    PRINT_JOBS_CODEC=compact python -m backend.scripts.migrate_print_jobs_compact [--batch-size N]
+
+Documents are rewritten in place, in _id order. Only documents still in the
+plain encoding are selected, so re-running after a crash continues where it
+stopped. Pause ingest (stop the API, agents keep spooling) while this runs,
+then start the API with PRINT_JOBS_CODEC=compact. The plain layout's indexes
+are dropped once no plain document is left.
+"""
+import argparse
+import asyncio
+import logging
+
+import motor.motor_asyncio
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+
+from backend.utils.db import MONGO_URI, DATABASE_NAME
+from backend.utils import job_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PLAIN_INDEXES = ("owner_email_1_print_date_-1", "owner_email_1_printer_id_1_print_date_-1")
+
+
+async def migrate(db, batch_size: int):
+    if not job_store.PRINT_JOBS_COMPACT:
+        raise SystemExit("Run with PRINT_JOBS_CODEC=compact.")
+    await job_store.ensure_collection(db)
+    jobs = job_store.collection(db)
+
+    inks = {}
+    async for printer in db["printers"].find({}, {"inks": 1}):
+        inks[str(printer["_id"])] = printer.get("inks", [])
+
+    plain = {"owner_email": {"$exists": True}}
+    total = await jobs.count_documents(plain)
+    converted, skipped, last_id = 0, 0, None
+    while True:
+        query = {**plain, "_id": {"$gt": last_id}} if last_id else plain
+        batch = [doc async for doc in jobs.find(query).sort("_id", 1).limit(batch_size)]
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        requests = []
+        for doc in batch:
+            printer_id = str(doc.get("printer_id"))
+            if not ObjectId.is_valid(printer_id):
+                # The compact encoding stores printer_id as an ObjectId.
+                skipped += 1
+                continue
+            encoded = await job_store.encode_job(db, doc, inks.get(printer_id, []))
+            requests.append(ReplaceOne({"_id": doc["_id"]}, encoded))
+        if requests:
+            await jobs.bulk_write(requests, ordered=False)
+        converted += len(requests)
+        logger.info(f"Converted {converted}/{total} jobs")
+
+    logger.info(f"Done: {converted} jobs converted, {skipped} with an invalid printer_id skipped")
+    if not skipped:
+        for name in PLAIN_INDEXES:
+            try:
+                await jobs.drop_index(name)
+                logger.info(f"Dropped index {name}")
+            except OperationFailure:
+                pass
+
+
+async def main(batch_size: int):
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+    try:
+        await migrate(client[DATABASE_NAME], batch_size)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,115 @@
+"""
+Moves an existing plain print_jobs collection into a time-series collection.
+
+    python -m backend.scripts.migrate_print_jobs_timeseries [--batch-size N] [--drop-legacy]
+
+Time-series collections cannot be renamed, so the plain collection is renamed
+to `<name>_legacy` and the new time-series collection takes its name. Pause
+ingest (stop the API, agents keep spooling) while this runs, then start the
+API with PRINT_JOBS_TIMESERIES=true. The copy is resumable: re-running it
+continues after the last copied _id (resuming after a crash deletes by _id
+from the time-series collection, which needs MongoDB 7.0+). The legacy collection is kept for
+rollback unless --drop-legacy is given.
+"""
+import argparse
+import logging
+
+import pymongo
+
+from backend.utils.db import MONGO_URI, DATABASE_NAME
+from backend.utils.dates import as_datetime, lost_in_storage
+from backend.utils.job_codec import PRINT_DATE_TEXT
+from backend.utils.job_store import (
+    META_FIELD, META_KEYS, PRINT_JOBS_COLLECTION, PRINT_JOBS_GRANULARITY,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEGACY_COLLECTION = f"{PRINT_JOBS_COLLECTION}_legacy"
+PROGRESS_ID = f"{PRINT_JOBS_COLLECTION}_timeseries"
+
+
+def to_timeseries(job: dict) -> dict:
+    """Same transformation as job_store.encode_job, applied to a stored document."""
+    doc = dict(job)
+    text = lost_in_storage(doc.get("print_date"))
+    if text is not None:
+        doc[PRINT_DATE_TEXT] = text
+    doc["print_date"] = as_datetime(doc.get("print_date"))
+    doc[META_FIELD] = {key: str(doc.pop(key, None)) for key in META_KEYS}
+    return doc
+
+
+def is_timeseries(db, name: str) -> bool:
+    info = next(db.list_collections(filter={"name": name}), None)
+    return bool(info and info.get("type") == "timeseries")
+
+
+def migrate(db, batch_size: int, drop_legacy: bool):
+    names = db.list_collection_names()
+    if PRINT_JOBS_COLLECTION in names and not is_timeseries(db, PRINT_JOBS_COLLECTION):
+        if LEGACY_COLLECTION in names:
+            raise SystemExit(f"Both {PRINT_JOBS_COLLECTION} and {LEGACY_COLLECTION} exist; resolve manually.")
+        db[PRINT_JOBS_COLLECTION].rename(LEGACY_COLLECTION)
+        logger.info(f"Renamed {PRINT_JOBS_COLLECTION} to {LEGACY_COLLECTION}")
+
+    if not is_timeseries(db, PRINT_JOBS_COLLECTION):
+        db.create_collection(
+            PRINT_JOBS_COLLECTION,
+            timeseries={"timeField": "print_date", "metaField": META_FIELD, "granularity": PRINT_JOBS_GRANULARITY},
+        )
+        logger.info(f"Created time-series collection {PRINT_JOBS_COLLECTION}")
+
+    if LEGACY_COLLECTION not in db.list_collection_names():
+        logger.info("Nothing to copy.")
+        return
+
+    progress = db["migrations"].find_one({"_id": PROGRESS_ID}) or {}
+    query = {"_id": {"$gt": progress["last_id"]}} if progress.get("last_id") else {}
+    legacy, target = db[LEGACY_COLLECTION], db[PRINT_JOBS_COLLECTION]
+    # A crash between inserting a batch and recording it leaves a partial batch
+    # behind; clear it so the re-copy does not duplicate jobs.
+    target.delete_many(query)
+    total = legacy.estimated_document_count()
+    copied, skipped, batch = progress.get("copied", 0), 0, []
+
+    def flush():
+        nonlocal copied
+        target.insert_many(batch, ordered=False)
+        copied += len(batch)
+        db["migrations"].update_one(
+            {"_id": PROGRESS_ID},
+            {"$set": {"last_id": batch[-1]["_id"], "copied": copied}},
+            upsert=True,
+        )
+        logger.info(f"Copied {copied}/{total} jobs")
+        batch.clear()
+
+    for job in legacy.find(query).sort("_id", 1).batch_size(batch_size):
+        doc = to_timeseries(job)
+        if doc["print_date"] is None:
+            # The timeField is mandatory; such jobs stay in the legacy collection.
+            skipped += 1
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    logger.info(f"Done: {copied} jobs copied, {skipped} without a usable print_date skipped")
+    if drop_legacy and not skipped:
+        legacy.drop()
+        db["migrations"].delete_one({"_id": PROGRESS_ID})
+        logger.info(f"Dropped {LEGACY_COLLECTION}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop-legacy", action="store_true")
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(MONGO_URI)
+    migrate(client[DATABASE_NAME], args.batch_size, args.drop_legacy)
@@ -0,0 +1,464 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from backend.utils.dates import as_datetime
+from backend.utils import job_store
+
+logger = logging.getLogger(__name__)
+
+# Total bytes all tenant tables may hold before the least recently used are evicted.
+ANALYTICS_MEMORY_BUDGET_MB = int(os.getenv("ANALYTICS_MEMORY_BUDGET_MB", 256))
+
+# Job ids are generated client side by each API worker, so they are not strictly
+# ordered across processes. Catch-up re-reads this much history behind the
+# newest id seen and skips the ids it already holds.
+CATCH_UP_SLACK = timedelta(seconds=60)
+
+# Queries producing more groups than this are rejected rather than built.
+ANALYTICS_MAX_GROUPS = int(os.getenv("ANALYTICS_MAX_GROUPS", 10000))
+
+# Group-by combinations up to this many are densified through a lookup
+# array; beyond it, by sorting the per-row code tuples.
+DENSE_GROUP_CELLS = 1 << 20
+
+INITIAL_CAPACITY = 1024
+LOAD_BATCH_SIZE = 10000
+
+NUMERIC_FIELDS = (
+    "copies", "width_mm", "length_mm", "printed_area_sqm", "printed_length_m",
+    "total_ink_ml", "ink_cost", "dpi_x", "dpi_y", "printed_pass", "print_ts",
+)
+CATEGORICAL_FIELDS = ("printer_id", "department", "job_status", "print_mode", "speed", "print_month")
+
+JOB_FIELDS = (
+    "printer_id", "job_status", "copies", "print_date", "width_mm", "length_mm",
+    "printed_area_sqm", "printed_length_m", "total_ink_ml", "ink_consumption_ml",
+    "dpi_x", "dpi_y", "print_mode", "speed", "printed_pass",
+)
+
+
+class AnalyticsQueryError(ValueError):
+    """Raised for queries that reference unknown fields or unsupported operators."""
+
+
+def _ink_cost(job: dict, printer: Optional[dict]) -> float:
+    """Raw ink cost of a job from the printer's per-liter prices (before the user coefficient)."""
+    if not printer:
+        return 0.0
+    prices = {k.lower(): v for k, v in (printer.get("ink_costs") or {}).items()}
+    return sum(
+        (ml or 0) / 1000 * prices.get(color.lower(), 0)
+        for color, ml in (job.get("ink_consumption_ml") or {}).items()
+    )
+
+
+def job_row(job: dict, printer: Optional[dict]) -> dict:
+    """Flattens a stored job (plus its printer) into the analytics columns."""
+    printed_at = as_datetime(job.get("print_date"))
+    row = {field: job.get(field) for field in NUMERIC_FIELDS}
+    row.update({
+        "ink_cost": _ink_cost(job, printer),
+        "print_ts": printed_at.timestamp() if printed_at else None,
+        "printer_id": str(job.get("printer_id")),
+        "department": (printer or {}).get("department"),
+        "job_status": job.get("job_status"),
+        "print_mode": job.get("print_mode"),
+        "speed": job.get("speed"),
+        "print_month": printed_at.strftime("%Y-%m") if printed_at else None,
+    })
+    return row
+
+
+class _Dictionary:
+    """Dictionary encoding for one categorical column."""
+
+    def __init__(self):
+        self.codes: Dict[object, int] = {}
+        self.values: List[object] = []
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def nbytes(self) -> int:
+        return 64 * len(self.values)
+
+
+class TenantTable:
+    """
+    Column store for one tenant's jobs. Numeric fields are float64 arrays with
+    NaN for missing values; categorical fields are int32 codes into a dictionary.
+    Arrays grow by doubling so appends are amortized O(1).
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.capacity = INITIAL_CAPACITY
+        self.numeric = {f: np.full(self.capacity, np.nan) for f in NUMERIC_FIELDS}
+        self.codes = {f: np.zeros(self.capacity, dtype=np.int32) for f in CATEGORICAL_FIELDS}
+        self.dictionaries = {f: _Dictionary() for f in CATEGORICAL_FIELDS}
+        self.high_water: Optional[ObjectId] = None
+        self._recent: "OrderedDict[ObjectId, None]" = OrderedDict()
+
+    def _grow(self):
+        self.capacity *= 2
+        for f, column in self.numeric.items():
+            grown = np.full(self.capacity, np.nan)
+            grown[:self.size] = column[:self.size]
+            self.numeric[f] = grown
+        for f, column in self.codes.items():
+            grown = np.zeros(self.capacity, dtype=np.int32)
+            grown[:self.size] = column[:self.size]
+            self.codes[f] = grown
+
+    def append(self, job_id: ObjectId, row: dict) -> bool:
+        """Adds a row unless the job is already present. Returns whether it was added."""
+        if job_id in self._recent:
+            return False
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        for f in NUMERIC_FIELDS:
+            value = row.get(f)
+            self.numeric[f][i] = np.nan if value is None else value
+        for f in CATEGORICAL_FIELDS:
+            self.codes[f][i] = self.dictionaries[f].encode(row.get(f))
+        self.size += 1
+        self._mark(job_id)
+        return True
+
+    def _mark(self, job_id: ObjectId):
+        """Remembers ids inside the catch-up window so re-reads can skip them."""
+        if self.high_water is None or job_id > self.high_water:
+            self.high_water = job_id
+            # Ids arrive in roughly time order, so expired ones are found at
+            # the front; a straggler further back just lingers a little longer.
+            horizon = job_id.generation_time - CATCH_UP_SLACK
+            while self._recent and next(iter(self._recent)).generation_time < horizon:
+                self._recent.popitem(last=False)
+        if job_id.generation_time >= self.high_water.generation_time - CATCH_UP_SLACK:
+            self._recent[job_id] = None
+
+    def drop_printer(self, printer_id: str):
+        """Removes every row of a printer, compacting the arrays in place."""
+        code = self.dictionaries["printer_id"].codes.get(printer_id)
+        if code is None:
+            return
+        keep = self.codes["printer_id"][:self.size] != code
+        kept = int(keep.sum())
+        for columns in (self.numeric, self.codes):
+            for f, column in columns.items():
+                # Into new arrays, so snapshots taken earlier keep their rows.
+                compacted = np.empty_like(column)
+                compacted[:kept] = column[:self.size][keep]
+                columns[f] = compacted
+        self.size = kept
+
+    def nbytes(self) -> int:
+        arrays = sum(c.nbytes for c in self.numeric.values()) + sum(c.nbytes for c in self.codes.values())
+        return arrays + sum(d.nbytes() for d in self.dictionaries.values()) + 64 * len(self._recent)
+
+    def snapshot(self) -> "TableView":
+        """
+        A read-only view of the rows present now. Appends only write past
+        `size` and growing or compacting allocates new arrays, so the view
+        stays consistent while the table changes, e.g. under a query
+        running in a worker thread.
+        """
+        return TableView(
+            self.size,
+            {f: column[:self.size] for f, column in self.numeric.items()},
+            {f: column[:self.size] for f, column in self.codes.items()},
+            self.dictionaries,
+        )
+
+    def query(self, spec) -> List[dict]:
+        return self.snapshot().query(spec)
+
+
+def _by_group(groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Stable ordering by group. Narrow group ids let numpy use a radix sort."""
+    return np.argsort(groups.astype(np.min_scalar_type(max(n_groups - 1, 0))), kind="stable")
+
+
+def _number(value):
+    return None if np.isnan(value) else (int(value) if float(value).is_integer() else float(value))
+
+
+class TableView:
+    """Query execution over a fixed set of rows of a TenantTable."""
+
+    def __init__(self, size: int, numeric: Dict[str, np.ndarray], codes: Dict[str, np.ndarray],
+                 dictionaries: Dict[str, _Dictionary]):
+        self.size = size
+        self.numeric = numeric
+        self.codes = codes
+        self.dictionaries = dictionaries
+
+    def _column(self, field: str) -> np.ndarray:
+        if field in self.numeric:
+            return self.numeric[field]
+        if field in self.codes:
+            return self.codes[field]
+        raise AnalyticsQueryError(f"Unknown field '{field}'")
+
+    def _check_filter(self, flt):
+        """Rejects values the column cannot be compared with, before numpy fails on them."""
+        if flt.op == "in":
+            if not isinstance(flt.value, list):
+                raise AnalyticsQueryError(f"Operator 'in' on '{flt.field}' needs a list of values")
+            values = flt.value
+        else:
+            values = [flt.value]
+        if any(isinstance(v, (list, dict)) for v in values):
+            raise AnalyticsQueryError(f"Filter values for '{flt.field}' must be single values")
+        if flt.field in self.numeric and any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in values):
+            raise AnalyticsQueryError(f"'{flt.field}' is numeric and can only be compared with numbers")
+
+    def _filter_mask(self, filters: list) -> np.ndarray:
+        mask = np.ones(self.size, dtype=bool)
+        for flt in filters:
+            column = self._column(flt.field)
+            self._check_filter(flt)
+            value = flt.value
+            if flt.field in self.dictionaries:
+                lookup = self.dictionaries[flt.field].codes
+                if flt.op == "eq":
+                    mask &= column == lookup.get(value, -1)
+                elif flt.op == "ne":
+                    mask &= column != lookup.get(value, -1)
+                elif flt.op == "in":
+                    mask &= np.isin(column, [lookup[v] for v in value if v in lookup])
+                else:
+                    raise AnalyticsQueryError(f"Operator '{flt.op}' is not supported on '{flt.field}'")
+                continue
+            if flt.op == "in":
+                mask &= np.isin(column, value)
+            else:
+                with np.errstate(invalid="ignore"):
+                    mask &= {
+                        "eq": np.equal, "ne": np.not_equal, "gt": np.greater,
+                        "gte": np.greater_equal, "lt": np.less, "lte": np.less_equal,
+                    }[flt.op](column, value)
+        return mask
+
+    def _group_keys(self, group_by: list, mask: np.ndarray):
+        """
+        Returns (group index per selected row, label tuple per group).
+        Categorical columns group by their dictionary codes as they are;
+        numeric ones are coded by np.unique first. The per-field codes are
+        combined with ravel_multi_index and densified with a bincount
+        lookup, or by sorting when there are too many combinations for one.
+        """
+        n_rows = int(mask.sum())
+        if not group_by:
+            return np.zeros(n_rows, dtype=np.int64), [()]
+        codes, dims, labelers = [], [], []
+        for field in group_by:
+            column = self._column(field)[mask]
+            if field in self.dictionaries:
+                values = self.dictionaries[field].values
+                codes.append(column.astype(np.int64))
+                dims.append(max(len(values), 1))
+                labelers.append(values.__getitem__)
+            else:
+                uniques, inverse = np.unique(column, return_inverse=True)
+                if len(uniques) > ANALYTICS_MAX_GROUPS:
+                    raise AnalyticsQueryError(
+                        f"'{field}' has {len(uniques)} distinct values; at most {ANALYTICS_MAX_GROUPS} groups are allowed"
+                    )
+                codes.append(inverse.ravel())
+                dims.append(max(len(uniques), 1))
+                labelers.append(lambda code, uniques=uniques: _number(uniques[code]))
+
+        cells = int(np.prod(dims, dtype=object))
+        if cells <= DENSE_GROUP_CELLS:
+            flat = np.ravel_multi_index(codes, dims) if len(codes) > 1 else codes[0]
+            occupied = np.flatnonzero(np.bincount(flat, minlength=cells))
+            remap = np.zeros(cells, dtype=np.int64)
+            remap[occupied] = np.arange(len(occupied))
+            keys = remap[flat]
+            combos = np.stack(np.unravel_index(occupied, dims), axis=1)
+        else:
+            combos, keys = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+            keys = keys.ravel()
+        if len(combos) > ANALYTICS_MAX_GROUPS:
+            raise AnalyticsQueryError(
+                f"The query has {len(combos)} groups; at most {ANALYTICS_MAX_GROUPS} are allowed"
+            )
+        labels = [tuple(label(int(code)) for label, code in zip(labelers, combo)) for combo in combos]
+        return keys, labels
+
+    def _aggregate(self, metric, groups: np.ndarray, n_groups: int, mask: np.ndarray) -> np.ndarray:
+        if metric.agg == "count":
+            return np.bincount(groups, minlength=n_groups).astype(float)
+
+        values = self._column(metric.field)[mask].astype(float)
+        valid = ~np.isnan(values)
+        if metric.agg in ("sum", "mean", "ratio"):
+            sums = np.bincount(groups, weights=np.where(valid, values, 0), minlength=n_groups)
+            if metric.agg == "sum":
+                return sums
+            if metric.agg == "mean":
+                counts = np.bincount(groups, weights=valid, minlength=n_groups)
+            else:
+                per = self._column(metric.per)[mask].astype(float)
+                counts = np.bincount(groups, weights=np.nan_to_num(per), minlength=n_groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(counts > 0, sums / counts, np.nan)
+
+        # min, max and percentile read each group's valid values as one
+        # contiguous, sorted run: [starts[g], starts[g] + counts[g]).
+        values, groups = values[valid], groups[valid]
+        counts = np.bincount(groups, minlength=n_groups)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        present = counts > 0
+        result = np.full(n_groups, np.nan)
+        if metric.agg in ("min", "max"):
+            values = values[_by_group(groups, n_groups)]
+            reduce = np.minimum if metric.agg == "min" else np.maximum
+            if present.any():
+                result[present] = reduce.reduceat(values, starts[present])
+            return result
+        order = np.argsort(values)
+        values = values[order[_by_group(groups[order], n_groups)]]
+        # Linear interpolation between the closest ranks, as np.percentile does.
+        position = starts[present] + (counts[present] - 1) * (metric.q / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        result[present] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        return result
+
+    def query(self, spec) -> List[dict]:
+        mask = self._filter_mask(spec.filters)
+        groups, labels = self._group_keys(spec.group_by, mask)
+        n_groups = len(labels)
+        results = {m.name: self._aggregate(m, groups, n_groups, mask) for m in spec.metrics}
+
+        rows = []
+        for g in range(n_groups):
+            row = dict(zip(spec.group_by, labels[g]))
+            for name, values in results.items():
+                row[name] = None if np.isnan(values[g]) else float(values[g])
+            rows.append(row)
+
+        if spec.order_by:
+            rows.sort(key=lambda r: (r.get(spec.order_by) is None, r.get(spec.order_by)), reverse=spec.descending)
+        return rows[:spec.limit] if spec.limit else rows
+
+
+class AnalyticsEngine:
+    """
+    Per-tenant cache of TenantTables, loaded from Mongo on first use, kept
+    current by appends from the ingest path plus an `_id` range catch-up on
+    every query (which also picks up jobs ingested by other workers), and
+    evicted least-recently-used under ANALYTICS_MEMORY_BUDGET_MB.
+
+    Printers can change on any worker, so every catch-up re-reads the
+    tenant's printers: rows of deleted printers are dropped, and a changed
+    department or ink price rebuilds the table, since both are baked into
+    the rows.
+    """
+
+    def __init__(self, memory_budget_bytes: int = ANALYTICS_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._tables: "OrderedDict[str, TenantTable]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._printers: Dict[str, Dict[str, dict]] = {}
+
+    async def _read_printers(self, db, owner_email: str) -> Dict[str, dict]:
+        printers = {}
+        async for printer in db["printers"].find(
+            {"owner_email": owner_email}, {"department": 1, "ink_costs": 1}
+        ):
+            printers[str(printer["_id"])] = printer
+        return printers
+
+    async def _read_jobs(self, db, owner_email: str, table: TenantTable, query: dict):
+        cursor = job_store.collection(db).find(query, job_store.projection(JOB_FIELDS)).batch_size(LOAD_BATCH_SIZE)
+        batch = []
+        async for job in cursor:
+            batch.append(job)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                await self._append_jobs(db, owner_email, table, batch)
+                batch = []
+        await self._append_jobs(db, owner_email, table, batch)
+
+    async def _append_jobs(self, db, owner_email: str, table: TenantTable, docs: list):
+        await job_store.prime(db, docs)
+        jobs = [job_store.decode_job(job) for job in docs]
+        printers = self._printers[owner_email]
+        if any(str(job.get("printer_id")) not in printers for job in jobs):
+            # The printer may have been registered after the printers were read.
+            # Only new printers are added; a changed one is left for the next
+            # comparison in `table` to notice.
+            for printer_id, printer in (await self._read_printers(db, owner_email)).items():
+                printers.setdefault(printer_id, printer)
+        for job in jobs:
+            printer = printers.get(str(job.get("printer_id")))
+            if printer is None:
+                # Orphaned job of a deleted printer.
+                continue
+            table.append(job["_id"], job_row(job, printer))
+
+    async def _catch_up(self, db, owner_email: str, table: TenantTable):
+        query = await job_store.job_query(db, owner_email)
+        if table.high_water is not None:
+            since = table.high_water.generation_time - CATCH_UP_SLACK
+            query["_id"] = {"$gt": ObjectId.from_datetime(since)}
+        await self._read_jobs(db, owner_email, table, query)
+
+    async def table(self, db, owner_email: str) -> TenantTable:
+        """Returns the tenant's table, loading it or catching it up first."""
+        lock = self._locks.setdefault(owner_email, asyncio.Lock())
+        async with lock:
+            known = self._printers.get(owner_email)
+            printers = self._printers[owner_email] = await self._read_printers(db, owner_email)
+            table = self._tables.get(owner_email)
+            if table is not None and known is not None:
+                if any(known[pid] != printers[pid] for pid in known.keys() & printers.keys()):
+                    logger.info(f"Printers of {owner_email} changed, rebuilding their analytics table")
+                    table = None
+                else:
+                    for printer_id in known.keys() - printers.keys():
+                        table.drop_printer(printer_id)
+            if table is None:
+                table = TenantTable()
+                await self._catch_up(db, owner_email, table)
+                logger.info(f"Loaded analytics table for {owner_email}: {table.size} jobs")
+                self._tables[owner_email] = table
+            else:
+                await self._catch_up(db, owner_email, table)
+            self._tables.move_to_end(owner_email)
+            self._evict()
+            return table
+
+    def append_job(self, owner_email: str, job_id: ObjectId, job: dict, printer: Optional[dict]):
+        """Ingest hook: adds a new job to the tenant's table if it is resident."""
+        table = self._tables.get(owner_email)
+        if table is not None:
+            table.append(job_id, job_row(job, printer))
+
+    def drop_printer(self, owner_email: str, printer_id: str):
+        self._printers.get(owner_email, {}).pop(printer_id, None)
+        table = self._tables.get(owner_email)
+        if table is not None:
+            table.drop_printer(printer_id)
+
+    def _evict(self):
+        total = sum(t.nbytes() for t in self._tables.values())
+        while total > self.memory_budget_bytes and len(self._tables) > 1:
+            owner_email, table = self._tables.popitem(last=False)
+            self._printers.pop(owner_email, None)
+            total -= table.nbytes()
+            logger.info(f"Evicted analytics table for {owner_email} ({table.size} jobs)")
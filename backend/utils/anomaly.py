@@ -0,0 +1,145 @@
+import asyncio
+import os
+import re
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+# A job is flagged when a metric is more than this many standard deviations from
+# the printer/print_mode mean, once at least ANOMALY_MIN_SAMPLES jobs were seen.
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 3.0))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", 30))
+
+STATS_COLLECTION = "job_stats"
+ANOMALIES_COLLECTION = "job_anomalies"
+
+
+def _metric_key(color: str) -> str:
+    """Colors become field names, so keep them to safe characters."""
+    return "ink_" + re.sub(r"[^a-z0-9]+", "_", color.lower()).strip("_")
+
+
+def job_metrics(job: dict) -> dict:
+    """Ink per square meter, in total and per color. Empty for jobs without printed area."""
+    area = job.get("printed_area_sqm") or 0
+    if area <= 0:
+        return {}
+    metrics = {"total_ink_per_sqm": (job.get("total_ink_ml") or 0) / area}
+    for color, ml in (job.get("ink_consumption_ml") or {}).items():
+        metrics[_metric_key(color)] = (ml or 0) / area
+    return metrics
+
+
+def _fold(stats: Optional[dict], x: float) -> dict:
+    """One step of Welford's algorithm on {n, mean, m2}."""
+    stats = stats or {}
+    n = stats.get("n", 0) + 1
+    delta = x - stats.get("mean", 0.0)
+    mean = stats.get("mean", 0.0) + delta / n
+    return {"n": n, "mean": mean, "m2": stats.get("m2", 0.0) + delta * (x - mean)}
+
+
+def _merge_update(batch: dict) -> list:
+    """
+    Update pipeline that merges a batch's {n, mean, m2} per metric into the
+    stored ones, using the parallel form of Welford's algorithm. Running it as a
+    single pipeline update keeps it atomic when several workers ingest for the
+    same printer.
+    """
+    merged = {}
+    for name, b in batch.items():
+        path = f"stats.{name}"
+        n_a = {"$ifNull": [f"${path}.n", 0]}
+        mean_a = {"$ifNull": [f"${path}.mean", 0]}
+        m2_a = {"$ifNull": [f"${path}.m2", 0]}
+        n = {"$add": [n_a, b["n"]]}
+        delta = {"$subtract": [b["mean"], mean_a]}
+        # Every expression reads the stored values; n is listed last so that
+        # holds even for evaluators that apply the fields in order.
+        merged[f"{path}.m2"] = {"$add": [
+            m2_a, b["m2"], {"$divide": [{"$multiply": [delta, delta, n_a, b["n"]]}, n]},
+        ]}
+        merged[f"{path}.mean"] = {"$add": [mean_a, {"$divide": [{"$multiply": [delta, b["n"]]}, n]}]}
+        merged[f"{path}.n"] = n
+    return [{"$set": {**merged, "updated_at": "$$NOW"}}]
+
+
+def _z_score(x: float, stats: Optional[dict]):
+    """z-score of x against stats gathered *before* it, or None while there is too little history."""
+    if not stats or stats.get("n", 0) < ANOMALY_MIN_SAMPLES:
+        return None
+    variance = stats["m2"] / (stats["n"] - 1)
+    if variance <= 0:
+        return None
+    return (x - stats["mean"]) / variance ** 0.5, stats["mean"], variance ** 0.5
+
+
+async def _observe_group(db, key: dict, members: list) -> list:
+    """Folds one printer/print_mode's jobs into its statistics and scores each job."""
+    batch = {}
+    for _, _, metrics in members:
+        for name, x in metrics.items():
+            batch[name] = _fold(batch.get(name), x)
+    before = await db[STATS_COLLECTION].find_one_and_update(
+        key,
+        _merge_update(batch),
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+
+    # Replay the batch on top of the stored statistics so every job is scored
+    # against the jobs before it, as if they had been ingested one at a time.
+    history = dict((before or {}).get("stats", {}))
+    anomalies = []
+    for job_id, job, metrics in members:
+        flagged = []
+        for name, x in metrics.items():
+            scored = _z_score(x, history.get(name))
+            if scored and abs(scored[0]) > ANOMALY_Z_THRESHOLD:
+                z, mean, std = scored
+                flagged.append({"metric": name, "value": x, "mean": mean, "std": std, "z_score": z})
+            history[name] = _fold(history.get(name), x)
+        if flagged:
+            anomalies.append({
+                **key,
+                "job_id": str(job_id),
+                "job_name": job.get("job_name"),
+                "print_date": job.get("print_date"),
+                "metrics": flagged,
+                "detected_at": datetime.utcnow(),
+            })
+    return anomalies
+
+
+async def observe_jobs(db, owner_email: str, jobs: Iterable[Tuple[str, object, dict]]) -> list:
+    """
+    Updates the running statistics of each job's printer and print_mode from
+    (printer_id, job_id, job) tuples in ingest order, and flags jobs whose
+    metrics deviate beyond ANOMALY_Z_THRESHOLD. One atomic update per
+    printer/print_mode in the batch, run concurrently, plus one insert for
+    all flagged jobs. Returns the anomaly documents.
+    """
+    groups = {}
+    for printer_id, job_id, job in jobs:
+        metrics = job_metrics(job)
+        if metrics:
+            key = (printer_id, job.get("print_mode"))
+            groups.setdefault(key, []).append((job_id, job, metrics))
+
+    results = await asyncio.gather(*(
+        _observe_group(db, {"owner_email": owner_email, "printer_id": printer_id, "print_mode": mode}, members)
+        for (printer_id, mode), members in groups.items()
+    ))
+    anomalies = [anomaly for group in results for anomaly in group]
+    if anomalies:
+        await db[ANOMALIES_COLLECTION].insert_many(anomalies)
+    return anomalies
+
+
+async def ensure_indexes(db):
+    # Unique so concurrent first uploads for a printer/mode upsert one document.
+    await db[STATS_COLLECTION].create_index(
+        [("owner_email", 1), ("printer_id", 1), ("print_mode", 1)], unique=True
+    )
+    await db[ANOMALIES_COLLECTION].create_index([("owner_email", 1), ("printer_id", 1), ("detected_at", -1)])
@@ -0,0 +1,88 @@
+from typing import Optional
+
+from bson import ObjectId
+
+from backend.utils import job_store
+from backend.utils.anomaly import ANOMALIES_COLLECTION, STATS_COLLECTION
+from backend.utils.task_queue import task
+
+CLEANUP_ORPHANS = "cleanup_orphans"
+
+# Documents deleted per round trip; progress is reported after each batch.
+CLEANUP_BATCH_SIZE = 5000
+
+
+async def _orphaned_printers(db, owner_email: str) -> list:
+    """Printer ids that jobs or ink fills still reference but that no longer exist."""
+    live = {str(p["_id"]) async for p in db["printers"].find({"owner_email": owner_email}, {"_id": 1})}
+    referenced = set()
+    jobs = job_store.collection(db)
+    for pid in await jobs.distinct(job_store.field("printer_id"), await job_store.job_query(db, owner_email)):
+        referenced.add(str(pid))
+    for pid in await db["ink_fills"].distinct("printer_id", {"owner_email": owner_email}):
+        referenced.add(str(pid))
+    return sorted(pid for pid in referenced - live if ObjectId.is_valid(pid))
+
+
+async def _delete_batched(collection, query: dict, on_batch) -> int:
+    deleted = 0
+    while True:
+        ids = [doc["_id"] async for doc in collection.find(query, {"_id": 1}).limit(CLEANUP_BATCH_SIZE)]
+        if not ids:
+            return deleted
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        await on_batch(result.deleted_count)
+
+
+async def _delete_jobs(jobs, query: dict, on_batch) -> int:
+    if job_store.PRINT_JOBS_TIMESERIES:
+        # Time-series collections take deletes by _id only from MongoDB 7.0;
+        # job_query filters on the metaField alone, which 5.0 deletes in one go.
+        result = await jobs.delete_many(query)
+        await on_batch(result.deleted_count)
+        return result.deleted_count
+    return await _delete_batched(jobs, query, on_batch)
+
+
+@task(CLEANUP_ORPHANS)
+async def cleanup_orphans(ctx, printer_id: Optional[str] = None) -> dict:
+    """
+    Deletes the jobs, ink fills and anomaly statistics of printers the owner
+    has deleted: just `printer_id`, or every orphaned printer when it is None.
+    A printer that exists again is left alone. Deleting in batches keeps each
+    write small and lets the task resume where it stopped after a retry.
+    """
+    db, owner = ctx.db, ctx.owner_email
+    if printer_id is None:
+        printer_ids = await _orphaned_printers(db, owner)
+    elif await db["printers"].find_one({"_id": ObjectId(printer_id), "owner_email": owner}, {"_id": 1}):
+        printer_ids = []
+    else:
+        printer_ids = [printer_id]
+
+    jobs = job_store.collection(db)
+    queries = []
+    for pid in printer_ids:
+        # Like job_query, match printer_id whether it was stored as a string or an ObjectId.
+        fill_query = {"owner_email": owner, "printer_id": {"$in": [pid, ObjectId(pid)]}}
+        queries.append((pid, await job_store.job_query(db, owner, printer_id=pid), fill_query))
+
+    total = 0
+    for _, job_query, fill_query in queries:
+        total += await jobs.count_documents(job_query) + await db["ink_fills"].count_documents(fill_query)
+    counts = {"printers": len(printer_ids), "jobs": 0, "ink_fills": 0}
+    await ctx.progress(0, total, f"{len(printer_ids)} orphaned printer(s)")
+
+    done = 0
+    async def advance(n):
+        nonlocal done
+        done += n
+        await ctx.progress(done)
+
+    for pid, job_query, fill_query in queries:
+        counts["jobs"] += await _delete_jobs(jobs, job_query, advance)
+        counts["ink_fills"] += await _delete_batched(db["ink_fills"], fill_query, advance)
+        await db[STATS_COLLECTION].delete_many({"owner_email": owner, "printer_id": pid})
+        await db[ANOMALIES_COLLECTION].delete_many({"owner_email": owner, "printer_id": pid})
+    return counts
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """Dates are stored either as BSON dates or ISO strings, depending on the writer."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def as_stored(value: datetime) -> datetime:
+    """What a BSON date gives back for `value`: naive UTC, truncated to milliseconds."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def lost_in_storage(value) -> Optional[str]:
+    """
+    `value` if it is a date string that a BSON date would not give back as
+    written (a UTC offset, sub-millisecond digits), otherwise None.
+    """
+    if not isinstance(value, str):
+        return None
+    parsed = as_datetime(value)
+    if parsed is not None and as_stored(parsed).isoformat() == value:
+        return None
+    return value
+
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Matches [start, end) whether the field holds a BSON date or an ISO string."""
+    if start is None and end is None:
+        return {}
+    as_date, as_string = {}, {}
+    if start is not None:
+        as_date["$gte"], as_string["$gte"] = start, start.isoformat()
+    if end is not None:
+        as_date["$lt"], as_string["$lt"] = end, end.isoformat()
+    return {"$or": [{field: as_date}, {field: as_string}]}
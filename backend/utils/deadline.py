@@ -0,0 +1,199 @@
+"""
+Request deadlines and load shedding.
+
+Every request gets a time budget from ROUTE_BUDGETS. The budget is applied
+with `pymongo.timeout()`, which Motor carries into its worker threads. The
+driver then sends the remaining budget with every operation as maxTimeMS
+and fails the operation once the deadline has passed. When the client
+disconnects, the request's handler is cancelled at its next await. An
+operation Motor already handed to the server is not killed; it runs on
+until it completes or reaches its maxTimeMS, so the budget is what bounds
+the server-side work of an abandoned request. Before any of that, read
+requests are rejected with 503 while too many requests are in flight or the
+event loop is lagging. Ingest has its own, higher limit, so agents keep
+getting through.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import pymongo
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", 10))
+
+# (method or None for any, path prefix, budget in seconds); first match wins.
+ROUTE_BUDGETS = [
+    # A batch carries up to 1000 jobs (jobs.MAX_BATCH_SIZE).
+    ("POST", "/jobs/batch", 30.0),
+    ("POST", "/jobs", 5.0),
+    ("POST", "/printers", 5.0),
+    (None, "/exports", 600.0),
+    (None, "/analytics", 120.0),
+    ("GET", "/jobs", 15.0),
+]
+
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", 100))
+MAX_INFLIGHT_INGEST = int(os.getenv("MAX_INFLIGHT_INGEST", 200))
+MAX_EVENT_LOOP_LAG_MS = float(os.getenv("MAX_EVENT_LOOP_LAG_MS", 250))
+
+LAG_SAMPLE_INTERVAL = 0.05
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None outside a request."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+def budget_for(method: str, path: str) -> float:
+    for route_method, prefix, budget in ROUTE_BUDGETS:
+        if (route_method is None or route_method == method) and path.startswith(prefix):
+            return budget
+    return DEFAULT_BUDGET_SECONDS
+
+
+def is_ingest(method: str, path: str) -> bool:
+    return method == "POST" and (path.startswith("/jobs") or path.endswith("/ink-fill"))
+
+
+# One path per ingest endpoint, as matched by is_ingest.
+INGEST_PATHS = ("/jobs", "/jobs/batch", "/printers/{printer_id}/ink-fill")
+
+
+def max_ingest_budget() -> float:
+    """The longest budget an ingest request can run under."""
+    return max(budget_for("POST", path) for path in INGEST_PATHS)
+
+
+class DeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.inflight = 0
+        self.inflight_ingest = 0
+        self.loop_lag_ms = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def _monitor_loop_lag(self):
+        """Measures how late the event loop wakes up from a short sleep."""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            lag = (time.monotonic() - started - LAG_SAMPLE_INTERVAL) * 1000
+            # Smoothed so only sustained lag sheds, not one slow request.
+            self.loop_lag_ms = 0.8 * self.loop_lag_ms + 0.2 * lag
+
+    def _stop_monitor(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    async def _lifespan(self, scope, receive, send):
+        """Passes lifespan events through, stopping the lag monitor on shutdown."""
+        async def shutdown_aware_receive():
+            message = await receive()
+            if message["type"] == "lifespan.shutdown":
+                self._stop_monitor()
+            return message
+
+        await self.app(scope, shutdown_aware_receive, send)
+
+    def _shed_reason(self, ingest: bool) -> Optional[str]:
+        if ingest:
+            if self.inflight_ingest >= MAX_INFLIGHT_INGEST:
+                return "Too many uploads in flight"
+            return None
+        if self.inflight >= MAX_INFLIGHT_REQUESTS:
+            return "Too many requests in flight"
+        if self.loop_lag_ms > MAX_EVENT_LOOP_LAG_MS:
+            return "Server is overloaded"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(scope, receive, send)
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._monitor_loop_lag())
+
+        method, path = scope["method"], scope["path"]
+        ingest = is_ingest(method, path)
+        reason = self._shed_reason(ingest)
+        if reason:
+            logger.warning(f"Shedding {method} {path}: {reason}")
+            response = JSONResponse({"detail": reason}, status_code=503, headers={"Retry-After": "1"})
+            return await response(scope, receive, send)
+
+        budget = budget_for(method, path)
+        if ingest:
+            self.inflight_ingest += 1
+        else:
+            self.inflight += 1
+        token = _deadline.set(time.monotonic() + budget)
+        try:
+            with pymongo.timeout(budget):
+                await self._run_until_disconnect(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+            if ingest:
+                self.inflight_ingest -= 1
+            else:
+                self.inflight -= 1
+
+    async def _run_until_disconnect(self, scope, receive, send):
+        """
+        Runs the app, cancelling it if the client goes away before it is done.
+        Cancellation does not reach a database operation already in progress.
+        """
+        body_read = asyncio.Event()
+        headers = dict(scope["headers"])
+        if b"content-length" not in headers and b"transfer-encoding" not in headers:
+            body_read.set()
+
+        async def tracking_receive():
+            message = await receive()
+            if message["type"] == "http.disconnect" or not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        response_sent = False
+
+        async def tracking_send(message):
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_sent = True
+            await send(message)
+
+        # Created inside pymongo.timeout() so the task inherits the deadline.
+        app_task = asyncio.create_task(self.app(scope, tracking_receive, tracking_send))
+
+        async def watch_disconnect():
+            # Only listen once the app has consumed the body, so the two never
+            # compete for request messages.
+            await body_read.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_sent:
+                        app_task.cancel()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not (app_task.cancelled() and watcher.done() and not response_sent):
+                # This request itself is being cancelled (e.g. on shutdown).
+                app_task.cancel()
+                raise
+            logger.info(f"Client disconnected, cancelled {scope['method']} {scope['path']}")
+        finally:
+            watcher.cancel()
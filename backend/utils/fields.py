@@ -0,0 +1,50 @@
+from typing import Annotated, Iterable, List, Optional, Set
+
+from fastapi import HTTPException, Query
+
+FieldsQuery = Annotated[
+    Optional[str],
+    Query(description="Comma-separated fields to return, e.g. 'job_name,print_date'. Defaults to all.")
+]
+ExpandQuery = Annotated[
+    Optional[str],
+    Query(description="Comma-separated references to inline in the response")
+]
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Validates a `fields=` parameter. None means the full shape was requested."""
+    names = _split(fields)
+    if not names:
+        return None
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return names
+
+
+def parse_expand(expand: Optional[str], allowed: Iterable[str]) -> Set[str]:
+    names = set(_split(expand))
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot expand: {', '.join(unknown)}")
+    return names
+
+
+def projection(fields: Optional[List[str]], required: Iterable[str] = ()) -> Optional[dict]:
+    """Mongo projection for the requested fields plus any the handler needs itself."""
+    if fields is None:
+        return None
+    return {name: 1 for name in [*fields, *required] if name != "id"}
+
+
+def select(item: dict, fields: Optional[List[str]], extra: Iterable[str] = ()) -> dict:
+    """Trims a helper's output to the requested fields; `id` is always kept."""
+    if fields is None:
+        return item
+    keep = {"id", *fields, *extra}
+    return {key: value for key, value in item.items() if key in keep}
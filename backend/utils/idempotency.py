@@ -0,0 +1,79 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from backend.utils.deadline import max_ingest_budget
+
+KEYS_COLLECTION = "job_keys"
+
+# Keys only need to outlive an agent's retry window; expiring them keeps the
+# index from growing with the job history.
+JOB_KEY_TTL_DAYS = int(os.getenv("JOB_KEY_TTL_DAYS", 30))
+
+# How long a claim may go without its job before it counts as abandoned by a
+# failed upload rather than held by one that is still in flight. An upload
+# can hold its claims for its whole budget and a little beyond it (work
+# between driver calls is not cut off), hence the margin.
+CLAIM_GRACE_MARGIN_SECONDS = 30
+CLAIM_GRACE = timedelta(seconds=max_ingest_budget() + CLAIM_GRACE_MARGIN_SECONDS)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def derive_key(job: dict) -> str:
+    """Key for jobs uploaded without one: the same job logged twice hashes the same."""
+    parts = [job.get("printer_id"), job.get("job_name"), job.get("print_date"), job.get("copies")]
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _key_id(owner_email: str, key: str) -> str:
+    return hashlib.sha256(f"{owner_email}\0{key}".encode()).hexdigest()
+
+
+async def claim_keys(db, owner_email: str, claims: Iterable[Tuple[str, ObjectId]]) -> Dict[str, dict]:
+    """
+    Records each (key, job_id) in one unordered bulk insert. The unique _id
+    index rejects keys that were claimed before; for those the original claim
+    document ({"job_id", "created_at"}) is returned, keyed by idempotency key.
+    """
+    claims = list(claims)
+    if not claims:
+        return {}
+    now = datetime.utcnow()
+    docs = [{"_id": _key_id(owner_email, key), "job_id": job_id, "created_at": now} for key, job_id in claims]
+    try:
+        await db[KEYS_COLLECTION].insert_many(docs, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        if any(err["code"] != DUPLICATE_KEY_ERROR for err in e.details["writeErrors"]):
+            raise
+        duplicate = {docs[err["index"]]["_id"]: claims[err["index"]][0] for err in e.details["writeErrors"]}
+
+    existing = {}
+    async for doc in db[KEYS_COLLECTION].find({"_id": {"$in": list(duplicate)}}):
+        existing[duplicate[doc["_id"]]] = doc
+    return existing
+
+
+async def release_keys(db, owner_email: str, claims: Iterable[Tuple[str, ObjectId]]):
+    """
+    Deletes claims this upload made itself, for when it gives up before
+    inserting any job. Matching on job_id leaves claims of other uploads alone.
+    """
+    claims = list(claims)
+    if claims:
+        await db[KEYS_COLLECTION].delete_many({
+            "$or": [{"_id": _key_id(owner_email, key), "job_id": job_id} for key, job_id in claims]
+        })
+
+
+def is_abandoned(claim: dict) -> bool:
+    return claim["created_at"] < datetime.utcnow() - CLAIM_GRACE
+
+
+async def ensure_indexes(db):
+    await db[KEYS_COLLECTION].create_index("created_at", expireAfterSeconds=JOB_KEY_TTL_DAYS * 86400)
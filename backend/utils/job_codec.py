@@ -0,0 +1,190 @@
+"""
+Compact encoding of print_jobs documents (PRINT_JOBS_CODEC=compact).
+
+Field names are shortened to one or two letters, the owner is stored as an
+integer tenant id, printer_id as an ObjectId and print_date as a BSON date.
+A BSON date is UTC with millisecond precision, so when the uploaded string
+has a UTC offset or finer digits it is kept as well and decoding returns it.
+`ink_consumption_ml` becomes an array of values plus the id of its ink
+layout: the color names in the order of the printer's `inks` list. Tenant
+ids and layouts are interned in their own small collections and cached per
+process; both mappings never change once written, so the caches never go
+stale. job_store routes all reads and writes through here when enabled.
+"""
+from typing import Callable, Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from backend.utils.dates import as_datetime, lost_in_storage
+
+# The uploaded print_date string, stored beside the date only when the date
+# alone would not give it back. Used by the time-series layout as well.
+PRINT_DATE_TEXT = "print_date_text"
+
+SHORT_KEYS = {
+    "owner_email": "o",
+    "printer_id": "p",
+    "job_name": "n",
+    "job_status": "s",
+    "copies": "c",
+    "print_date": "d",
+    "width_mm": "w",
+    "length_mm": "l",
+    "printed_area_sqm": "a",
+    "printed_length_m": "m",
+    "total_ink_ml": "t",
+    "ink_consumption_ml": "i",
+    "dpi_x": "x",
+    "dpi_y": "y",
+    "print_mode": "pm",
+    "speed": "sp",
+    "printed_pass": "ps",
+    PRINT_DATE_TEXT: "dt",
+}
+LONG_KEYS = {short: name for name, short in SHORT_KEYS.items()}
+
+# Id of the ink layout the "i" array is aligned to.
+LAYOUT_KEY = "k"
+
+TENANTS_COLLECTION = "tenants"
+INK_LAYOUTS_COLLECTION = "job_ink_layouts"
+COUNTERS_COLLECTION = "counters"
+
+_LAYOUT_SEPARATOR = "\x1f"
+
+
+class Interner:
+    """
+    Maps values to small integers through a collection of {_id: int, key: str}
+    documents. Ids are allocated from a counter; the unique index on `key`
+    makes concurrent first uses of a value agree on one id.
+    """
+
+    def __init__(self, collection: str, to_key: Callable = str, from_key: Callable = str):
+        self.collection = collection
+        self.to_key = to_key
+        self.from_key = from_key
+        self._ids: Dict[str, int] = {}
+        self._values: Dict[int, object] = {}
+
+    def _remember(self, doc: dict):
+        self._ids[doc["key"]] = doc["_id"]
+        self._values[doc["_id"]] = self.from_key(doc["key"])
+
+    async def id_for(self, db, value) -> int:
+        """The value's id, allocating one on first use."""
+        key = self.to_key(value)
+        if key in self._ids:
+            return self._ids[key]
+        doc = await db[self.collection].find_one({"key": key})
+        if doc is None:
+            counter = await db[COUNTERS_COLLECTION].find_one_and_update(
+                {"_id": self.collection}, {"$inc": {"seq": 1}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            doc = {"_id": counter["seq"], "key": key}
+            try:
+                await db[self.collection].insert_one(doc)
+            except DuplicateKeyError:
+                # Another worker interned the same value first; use its id.
+                doc = await db[self.collection].find_one({"key": key})
+        self._remember(doc)
+        return doc["_id"]
+
+    async def lookup(self, db, value) -> Optional[int]:
+        """The value's id, or None if it was never interned. Never allocates, so reads can use it."""
+        key = self.to_key(value)
+        if key not in self._ids:
+            doc = await db[self.collection].find_one({"key": key})
+            if doc is None:
+                return None
+            self._remember(doc)
+        return self._ids[key]
+
+    async def load(self, db, ids: Iterable[int]):
+        """Caches the values of ids this process has not seen yet."""
+        missing = {i for i in ids if i is not None and i not in self._values}
+        if missing:
+            async for doc in db[self.collection].find({"_id": {"$in": list(missing)}}):
+                self._remember(doc)
+
+    def value(self, id_: int):
+        return self._values[id_]
+
+    async def ensure_indexes(self, db):
+        await db[self.collection].create_index("key", unique=True)
+
+
+TENANTS = Interner(TENANTS_COLLECTION)
+INK_LAYOUTS = Interner(
+    INK_LAYOUTS_COLLECTION,
+    to_key=_LAYOUT_SEPARATOR.join,
+    from_key=lambda key: tuple(key.split(_LAYOUT_SEPARATOR)),
+)
+
+
+def ink_layout(consumption: dict, inks: Iterable[str] = ()) -> tuple:
+    """The job's colors in the printer's `inks` order, then any the printer does not list."""
+    order = {ink: i for i, ink in enumerate(inks)}
+    return tuple(sorted(consumption, key=lambda color: (order.get(color, len(order)), color)))
+
+
+def pack(job: dict, tenant_id: int, layout_id: Optional[int], layout: tuple) -> dict:
+    """Compact document for a plain-layout job, given its interned tenant and ink layout."""
+    doc = {}
+    for name, value in job.items():
+        if name not in ("owner_email", "ink_consumption_ml"):
+            doc[SHORT_KEYS.get(name, name)] = value
+    doc[SHORT_KEYS["owner_email"]] = tenant_id
+    doc[SHORT_KEYS["printer_id"]] = ObjectId(str(job["printer_id"]))
+    doc[SHORT_KEYS["print_date"]] = as_datetime(job.get("print_date"))
+    text = lost_in_storage(job.get("print_date"))
+    if text is not None:
+        doc[SHORT_KEYS[PRINT_DATE_TEXT]] = text
+    consumption = job.get("ink_consumption_ml") or {}
+    if consumption:
+        doc[LAYOUT_KEY] = layout_id
+        doc[SHORT_KEYS["ink_consumption_ml"]] = [consumption[color] for color in layout]
+    return doc
+
+
+def unpack(doc: dict, tenants: Callable, layouts: Callable) -> dict:
+    """Plain-layout job for a compact document. Long keys pass through unchanged."""
+    job = {}
+    for key, value in doc.items():
+        if key != LAYOUT_KEY:
+            job[LONG_KEYS.get(key, key)] = value
+    if PRINT_DATE_TEXT in job:
+        job["print_date"] = job.pop(PRINT_DATE_TEXT)
+    tenant_id = doc.get(SHORT_KEYS["owner_email"])
+    if tenant_id is not None:
+        job["owner_email"] = tenants(tenant_id)
+    values = doc.get(SHORT_KEYS["ink_consumption_ml"])
+    if values is not None:
+        job["ink_consumption_ml"] = dict(zip(layouts(doc[LAYOUT_KEY]), values))
+    return job
+
+
+async def encode(db, job: dict, inks: Iterable[str] = ()) -> dict:
+    layout = ink_layout(job.get("ink_consumption_ml") or {}, inks)
+    layout_id = await INK_LAYOUTS.id_for(db, layout) if layout else None
+    return pack(job, await TENANTS.id_for(db, job["owner_email"]), layout_id, layout)
+
+
+def decode(doc: dict) -> dict:
+    """Needs the document's tenant and layout cached, see `prime`."""
+    return unpack(doc, TENANTS.value, INK_LAYOUTS.value)
+
+
+async def prime(db, docs: Iterable[dict]):
+    """Caches the tenants and ink layouts referenced by `docs` so they can be decoded."""
+    docs = list(docs)
+    await TENANTS.load(db, {doc.get(SHORT_KEYS["owner_email"]) for doc in docs})
+    await INK_LAYOUTS.load(db, {doc.get(LAYOUT_KEY) for doc in docs})
+
+
+async def ensure_indexes(db):
+    await TENANTS.ensure_indexes(db)
+    await INK_LAYOUTS.ensure_indexes(db)
@@ -0,0 +1,184 @@
+"""
+Storage layout of the print_jobs collection.
+
+Routers build job queries, projections and documents through this module
+instead of hard-coding field paths, so the same code works whether
+print_jobs is a plain collection or a MongoDB time-series collection
+(PRINT_JOBS_TIMESERIES=true). In the time-series layout `print_date` is the
+timeField (a BSON date) and `owner_email`/`printer_id` live under the
+`meta` metaField. Both it and the compact codec keep the uploaded print_date
+string too when a BSON date would not give it back as written (UTC offset,
+sub-millisecond digits), so reads return print_date as the plain layout does. With PRINT_JOBS_CODEC=compact, plain documents are stored
+in the short encoding of job_codec instead.
+
+Owners are interned as tenant ids under the compact codec, so building a job
+query and encoding a job are async. Only encoding allocates a tenant id; a
+query for an owner without one matches nothing. Documents read from the collection go
+through `prime` (async, once per batch) before `decode_job`.
+"""
+import os
+from datetime import datetime
+from typing import Iterable, Optional
+
+from bson import ObjectId
+
+from backend.utils import job_codec
+from backend.utils.dates import as_datetime, date_range, lost_in_storage
+
+PRINT_JOBS_COLLECTION = os.getenv("PRINT_JOBS_COLLECTION", "print_jobs")
+PRINT_JOBS_TIMESERIES = os.getenv("PRINT_JOBS_TIMESERIES", "false").lower() in ("1", "true", "yes")
+
+# A printer logs jobs minutes to hours apart, so "hours" (buckets spanning up
+# to 30 days) keeps buckets full without splitting them by the minute.
+PRINT_JOBS_GRANULARITY = os.getenv("PRINT_JOBS_GRANULARITY", "hours")
+
+# "plain" stores jobs as uploaded; "compact" uses job_codec (plain collections only).
+PRINT_JOBS_CODEC = os.getenv("PRINT_JOBS_CODEC", "plain").lower()
+PRINT_JOBS_COMPACT = PRINT_JOBS_CODEC == "compact"
+
+META_FIELD = "meta"
+META_KEYS = ("owner_email", "printer_id")
+
+
+def collection(db):
+    return db[PRINT_JOBS_COLLECTION]
+
+
+def field(name: str) -> str:
+    """Stored path of a job field as it appears in the API (`job_helper`) shape."""
+    if PRINT_JOBS_COMPACT:
+        return job_codec.SHORT_KEYS.get(name, name)
+    if PRINT_JOBS_TIMESERIES and name in META_KEYS:
+        return f"{META_FIELD}.{name}"
+    return name
+
+
+def print_date_expr() -> object:
+    """Aggregation expression for print_date as a BSON date in any layout."""
+    if PRINT_JOBS_TIMESERIES or PRINT_JOBS_COMPACT:
+        return f"${field('print_date')}"
+    return {"$convert": {"input": "$print_date", "to": "date", "onError": None, "onNull": None}}
+
+
+def printer_ref_expr(printer_id_expr) -> object:
+    """Aggregation expression turning a printer's _id into the value jobs store as printer_id."""
+    if PRINT_JOBS_COMPACT:
+        return printer_id_expr
+    return {"$toString": printer_id_expr}
+
+
+def projection(fields: Iterable[str]) -> dict:
+    fields = list(fields)
+    paths = {field(name): 1 for name in fields}
+    if (PRINT_JOBS_TIMESERIES or PRINT_JOBS_COMPACT) and "print_date" in fields:
+        paths[field(job_codec.PRINT_DATE_TEXT)] = 1
+    if PRINT_JOBS_COMPACT and "ink_consumption_ml" in fields:
+        paths[job_codec.LAYOUT_KEY] = 1
+    return paths
+
+
+async def owner_value(db, owner_email: str):
+    """
+    What print_jobs stores for the owner: the email, or its tenant id under
+    the compact codec. None for an owner without a tenant id, who has no jobs;
+    only encode_job allocates tenant ids.
+    """
+    if PRINT_JOBS_COMPACT:
+        return await job_codec.TENANTS.lookup(db, owner_email)
+    return owner_email
+
+
+async def job_query(db, owner_email: str, printer_id: Optional[str] = None,
+                    start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+    """Filter for a user's jobs, optionally narrowed to one printer and a [start, end) window."""
+    owner = await owner_value(db, owner_email)
+    clauses = [{field("owner_email"): owner if owner is not None else {"$in": []}}]
+    if printer_id:
+        if PRINT_JOBS_COMPACT:
+            clauses.append({field("printer_id"): ObjectId(printer_id)})
+        elif PRINT_JOBS_TIMESERIES:
+            clauses.append({field("printer_id"): printer_id})
+        else:
+            # Older writers stored printer_id as an ObjectId.
+            clauses.append({"$or": [{"printer_id": printer_id}, {"printer_id": ObjectId(printer_id)}]})
+    if start is not None or end is not None:
+        if PRINT_JOBS_TIMESERIES or PRINT_JOBS_COMPACT:
+            window = {}
+            if start is not None:
+                window["$gte"] = start
+            if end is not None:
+                window["$lt"] = end
+            clauses.append({field("print_date"): window})
+        else:
+            clauses.append(date_range("print_date", start, end))
+    return {"$and": clauses} if len(clauses) > 1 else clauses[0]
+
+
+async def encode_job(db, job: dict, inks: Iterable[str] = ()) -> dict:
+    """
+    Turns a validated, JSON-encoded PrintJob into the document to insert.
+    `inks` is the printer's ink list, which orders the compact ink array.
+    """
+    if PRINT_JOBS_COMPACT:
+        return await job_codec.encode(db, job, inks)
+    doc = dict(job)
+    if PRINT_JOBS_TIMESERIES:
+        text = lost_in_storage(doc["print_date"])
+        if text is not None:
+            doc[job_codec.PRINT_DATE_TEXT] = text
+        doc["print_date"] = as_datetime(doc["print_date"])
+        doc[META_FIELD] = {key: str(doc.pop(key)) for key in META_KEYS}
+    return doc
+
+
+async def prime(db, docs: Iterable[dict]):
+    """Loads what `decode_job` needs for these stored documents; a no-op unless compact."""
+    if PRINT_JOBS_COMPACT:
+        await job_codec.prime(db, docs)
+
+
+def decode_job(doc: dict) -> dict:
+    """Flattens a stored document back to the plain layout read by `job_helper`."""
+    if PRINT_JOBS_COMPACT:
+        return job_codec.decode(doc)
+    meta = doc.get(META_FIELD)
+    if isinstance(meta, dict) or job_codec.PRINT_DATE_TEXT in doc:
+        doc = dict(doc)
+        doc.update(doc.pop(META_FIELD, None) or {})
+        if job_codec.PRINT_DATE_TEXT in doc:
+            doc["print_date"] = doc.pop(job_codec.PRINT_DATE_TEXT)
+    return doc
+
+
+async def ensure_collection(db):
+    """
+    Creates print_jobs with the configured layout and its query indexes.
+    Raises if an existing collection does not match PRINT_JOBS_TIMESERIES.
+    """
+    jobs = collection(db)
+    if PRINT_JOBS_COMPACT:
+        if PRINT_JOBS_TIMESERIES:
+            raise RuntimeError("PRINT_JOBS_CODEC=compact requires a plain print_jobs collection")
+        await job_codec.ensure_indexes(db)
+    existing = await db.list_collections(filter={"name": PRINT_JOBS_COLLECTION}).to_list(None)
+    if existing and (existing[0].get("type") == "timeseries") != PRINT_JOBS_TIMESERIES:
+        # Queries and documents built for one layout silently miss every job
+        # stored in the other, so refuse to start rather than serve empty results.
+        raise RuntimeError(
+            f"{PRINT_JOBS_COLLECTION} is a {existing[0].get('type', 'collection')} but "
+            f"PRINT_JOBS_TIMESERIES={'true' if PRINT_JOBS_TIMESERIES else 'false'}; "
+            "convert it with `python -m backend.scripts.migrate_print_jobs_timeseries` "
+            "or change the setting"
+        )
+    if PRINT_JOBS_TIMESERIES:
+        if not existing:
+            await db.create_collection(
+                PRINT_JOBS_COLLECTION,
+                timeseries={
+                    "timeField": "print_date",
+                    "metaField": META_FIELD,
+                    "granularity": PRINT_JOBS_GRANULARITY,
+                },
+            )
+    await jobs.create_index([(field("owner_email"), 1), (field("print_date"), -1)])
+    await jobs.create_index([(field("owner_email"), 1), (field("printer_id"), 1), (field("print_date"), -1)])
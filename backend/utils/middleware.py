@@ -0,0 +1,59 @@
+import zlib
+
+from starlette.responses import PlainTextResponse
+
+# Largest request body accepted after decompression.
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+
+class GZipRequestMiddleware:
+    """
+    Accepts request bodies sent with `Content-Encoding: gzip` (as the agent
+    does for job batches) and hands the decompressed body to the routers.
+    """
+
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if headers.get(b"content-encoding", b"").lower() != b"gzip":
+            return await self.app(scope, receive, send)
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = bytearray()
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                # Bound the output so a small zip bomb cannot exhaust memory.
+                body += decompressor.decompress(message.get("body", b""), self.max_size + 1 - len(body))
+                if len(body) > self.max_size or decompressor.unconsumed_tail:
+                    response = PlainTextResponse("Request body too large", status_code=413)
+                    return await response(scope, receive, send)
+            body += decompressor.flush()
+        except zlib.error:
+            response = PlainTextResponse("Invalid gzip request body", status_code=400)
+            return await response(scope, receive, send)
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+
+        sent = False
+
+        async def decompressed_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": bytes(body), "more_body": False}
+            return await receive()
+
+        await self.app(scope, decompressed_receive, send)
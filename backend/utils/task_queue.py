@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+TASKS_COLLECTION = "tasks"
+
+# A claimed task belongs to its worker until the lease runs out. Running tasks
+# renew it every third of the lease, so a lease only lapses when the worker died
+# or hung, and then another worker picks the task up again.
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", 60))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", 5))
+TASK_RETRY_BASE_SECONDS = int(os.getenv("TASK_RETRY_BASE_SECONDS", 10))
+
+# Running tasks per tenant across all workers, so one tenant's backlog cannot
+# starve the others.
+TASK_TENANT_CONCURRENCY = int(os.getenv("TASK_TENANT_CONCURRENCY", 2))
+
+# Finished tasks stay queryable through /tasks/{id} for this long.
+TASK_RESULT_TTL_DAYS = int(os.getenv("TASK_RESULT_TTL_DAYS", 7))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+TASKS: Dict[str, Callable[..., Awaitable]] = {}
+
+
+class LeaseLost(Exception):
+    """The task's lease expired and another worker may be running it now."""
+
+
+def task(name: str):
+    """Registers an async handler(ctx, **params) under `name`."""
+    def register(handler):
+        TASKS[name] = handler
+        return handler
+    return register
+
+
+async def enqueue(db, owner_email: str, name: str, params: Optional[dict] = None) -> str:
+    if name not in TASKS:
+        raise ValueError(f"Unknown task: {name}")
+    now = datetime.utcnow()
+    result = await db[TASKS_COLLECTION].insert_one({
+        "owner_email": owner_email,
+        "name": name,
+        "params": params or {},
+        "status": QUEUED,
+        "attempts": 0,
+        "run_after": now,
+        "lease_until": None,
+        "worker": None,
+        "progress": {"done": 0, "total": None, "message": None},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+    })
+    return str(result.inserted_id)
+
+
+async def _saturated_owners(db, now: datetime) -> list:
+    pipeline = [
+        {"$match": {"status": RUNNING, "lease_until": {"$gt": now}}},
+        {"$group": {"_id": "$owner_email", "running": {"$sum": 1}}},
+        {"$match": {"running": {"$gte": TASK_TENANT_CONCURRENCY}}},
+    ]
+    return [row["_id"] async for row in db[TASKS_COLLECTION].aggregate(pipeline)]
+
+
+async def claim(db, worker_id: str) -> Optional[dict]:
+    """
+    Leases the oldest runnable task: a queued one that is due, or a running
+    one whose lease lapsed. Tenants already at TASK_TENANT_CONCURRENCY are
+    skipped. The limit is read before the claim, so workers claiming at the
+    same moment can overshoot it by one task each.
+    """
+    now = datetime.utcnow()
+    return await db[TASKS_COLLECTION].find_one_and_update(
+        {
+            "owner_email": {"$nin": await _saturated_owners(db, now)},
+            "$or": [
+                {"status": QUEUED, "run_after": {"$lte": now}},
+                {"status": RUNNING, "lease_until": {"$lte": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": RUNNING,
+                "worker": worker_id,
+                "lease_until": now + timedelta(seconds=TASK_LEASE_SECONDS),
+                "started_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _update_owned(db, task: dict, update: dict) -> bool:
+    """Applies `update` only while this worker still holds the task's lease."""
+    result = await db[TASKS_COLLECTION].update_one(
+        {"_id": task["_id"], "status": RUNNING, "worker": task["worker"], "attempts": task["attempts"]},
+        update,
+    )
+    return result.matched_count == 1
+
+
+class TaskContext:
+    """What a handler gets: the database, the task's owner and a progress reporter."""
+
+    def __init__(self, db, task: dict):
+        self.db = db
+        self.task = task
+        self.owner_email = task["owner_email"]
+
+    async def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Records progress and renews the lease. Raises LeaseLost if the task was taken over."""
+        update = {
+            "progress.done": done,
+            "lease_until": datetime.utcnow() + timedelta(seconds=TASK_LEASE_SECONDS),
+        }
+        if total is not None:
+            update["progress.total"] = total
+        if message is not None:
+            update["progress.message"] = message
+        if not await _update_owned(self.db, self.task, {"$set": update}):
+            raise LeaseLost(str(self.task["_id"]))
+
+
+async def _heartbeat(db, task: dict, handler: asyncio.Task):
+    while True:
+        await asyncio.sleep(TASK_LEASE_SECONDS / 3)
+        lease_until = datetime.utcnow() + timedelta(seconds=TASK_LEASE_SECONDS)
+        if not await _update_owned(db, task, {"$set": {"lease_until": lease_until}}):
+            logger.warning("Lost the lease on task %s, stopping it", task["_id"])
+            handler.cancel()
+            return
+
+
+async def run_task(db, task: dict):
+    """Runs one claimed task and records its outcome: success, a retry with backoff, or failure."""
+    now = datetime.utcnow()
+    handler = TASKS.get(task["name"])
+    if handler is None or task["attempts"] > TASK_MAX_ATTEMPTS:
+        error = f"Unknown task: {task['name']}" if handler is None else "Too many attempts"
+        await _update_owned(db, task, {"$set": {"status": FAILED, "error": error, "finished_at": now}})
+        return
+
+    running = asyncio.ensure_future(handler(TaskContext(db, task), **task["params"]))
+    heartbeat = asyncio.ensure_future(_heartbeat(db, task, running))
+    try:
+        result = await running
+    except LeaseLost:
+        return
+    except asyncio.CancelledError:
+        if heartbeat.done():
+            # The heartbeat stopped the handler after losing the lease.
+            return
+        # The worker is shutting down: hand the task back without using up an attempt.
+        await _update_owned(db, task, {
+            "$set": {"status": QUEUED, "run_after": datetime.utcnow(), "lease_until": None},
+            "$inc": {"attempts": -1},
+        })
+        raise
+    except Exception as e:
+        logger.exception("Task %s (%s) failed", task["_id"], task["name"])
+        now = datetime.utcnow()
+        if task["attempts"] < TASK_MAX_ATTEMPTS:
+            delay = timedelta(seconds=TASK_RETRY_BASE_SECONDS * 2 ** (task["attempts"] - 1))
+            update = {"status": QUEUED, "run_after": now + delay, "lease_until": None, "error": str(e)}
+        else:
+            update = {"status": FAILED, "error": str(e), "finished_at": now}
+        await _update_owned(db, task, {"$set": update})
+        return
+    finally:
+        heartbeat.cancel()
+
+    await _update_owned(db, task, {"$set": {
+        "status": SUCCEEDED, "result": result, "error": None, "finished_at": datetime.utcnow(),
+    }})
+
+
+async def run_worker(db, concurrency: int = 4, poll_seconds: float = 2.0, worker_id: Optional[str] = None,
+                     stop: Optional[asyncio.Event] = None):
+    """
+    Claims and runs tasks until `stop` is set, at most `concurrency` at a time.
+    Tasks still running at shutdown are cancelled and put back in the queue.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or asyncio.Event()
+    running = set()
+    logger.info("Task worker %s started (concurrency %d)", worker_id, concurrency)
+    try:
+        while not stop.is_set():
+            claimed = None
+            if len(running) < concurrency:
+                claimed = await claim(db, worker_id)
+            if claimed:
+                logger.info("Running task %s (%s), attempt %d", claimed["_id"], claimed["name"], claimed["attempts"])
+                running.add(asyncio.ensure_future(run_task(db, claimed)))
+                continue
+            # Nothing to claim, or no free slot: wait for a slot, new work or shutdown.
+            waiters = [*running, asyncio.ensure_future(stop.wait())]
+            done, _ = await asyncio.wait(waiters, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+            waiters[-1].cancel()
+            for finished in done & running:
+                if finished.exception():
+                    logger.error("Task bookkeeping failed", exc_info=finished.exception())
+            running -= done
+    finally:
+        for pending in running:
+            pending.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        logger.info("Task worker %s stopped", worker_id)
+
+
+async def ensure_indexes(db):
+    await db[TASKS_COLLECTION].create_index([("status", 1), ("run_after", 1)])
+    await db[TASKS_COLLECTION].create_index([("owner_email", 1), ("created_at", -1)])
+    # Only finished tasks have finished_at set, so only they expire.
+    await db[TASKS_COLLECTION].create_index("finished_at", expireAfterSeconds=TASK_RESULT_TTL_DAYS * 86400)
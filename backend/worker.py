@@ -0,0 +1,45 @@
+"""
+Background task worker.
+
+    python -m backend.worker [--concurrency N]
+
+Runs tasks queued by the API (see backend.utils.task_queue) against the same
+database. Start as many workers as needed; tasks are leased, so each runs
+on one worker at a time. SIGINT/SIGTERM hand running tasks back to the queue.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+import motor.motor_asyncio
+
+from backend.utils.db import MONGO_URI, DATABASE_NAME
+from backend.utils import task_queue
+from backend.utils import cleanup  # noqa: F401  registers the built-in tasks
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main(concurrency: int, poll_seconds: float):
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+    db = client[DATABASE_NAME]
+    await task_queue.ensure_indexes(db)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await task_queue.run_worker(db, concurrency=concurrency, poll_seconds=poll_seconds, stop=stop)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--poll-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.poll_seconds))
@@ -59,6 +59,9 @@ const getInkColor = (colorName, index) => {
   return INK_COLORS[c] || INK_COLORS[`default${(index % 2) + 1}`] || '#6c757d';
 };
 
+// The job fields the charts and cost calculations below read.
+const DASHBOARD_JOB_FIELDS = 'printer_id,print_date,copies,printed_area_sqm,total_ink_ml,ink_consumption_ml';
+
 // --- Helper Functions ---
 
 const getLastNDays = (n) => {
@@ -114,9 +117,12 @@ const DashboardPage = () => {
       try {
         setPageLoading(true);
         
+        // Per-printer activity comes from the overview. The daily charts,
+        // costs and all-time ink totals still need job rows, trimmed to
+        // the fields they use.
         const [printersRes, jobsRes] = await Promise.all([
-          api.get('/printers/'),
-          api.get('/jobs/'),
+          api.get('/printers/overview'),
+          api.get('/jobs/', { params: { fields: DASHBOARD_JOB_FIELDS } }),
         ]);
         
         const printers = printersRes.data || [];
@@ -159,22 +165,18 @@ const DashboardPage = () => {
       // --- 1. Process KPIs (Last 30 Days) ---
       let totalCost = 0;
       let totalArea = 0;
-      const printerCounts = {};
 
       jobsLast30Days.forEach(job => {
         totalCost += calculateJobCost(job, printers, settings);
         totalArea += job.printed_area_sqm || 0;
-        printerCounts[job.printer_id] = (printerCounts[job.printer_id] || 0) + (job.copies || 1);
       });
 
       let mostActivePrinter = "N/A";
-      if (Object.keys(printerCounts).length > 0) {
-        const mostActiveId = Object.keys(printerCounts).reduce((a, b) => 
-          printerCounts[a] > printerCounts[b] ? a : b
-        );
-        const printer = printers.find(p => p.id === mostActiveId);
-        if (printer) mostActivePrinter = printer.printer_name;
-      }
+      const busiest = printers.reduce(
+        (best, p) => (p.activity.copies_30d > (best ? best.activity.copies_30d : 0) ? p : best),
+        null
+      );
+      if (busiest) mostActivePrinter = busiest.printer_name;
       
       setKpiData({
         totalCost: `${totalCost.toFixed(2)} ${currency}`,
@@ -30,17 +30,15 @@ const JobDetailPage = () => {
     const fetchJobAndPrinter = async () => {
       try {
         setLoading(true);
-        // 1. Fetch the job
-        const jobResponse = await api.get(`/jobs/${jobId}`);
-        const jobData = jobResponse.data;
+        // Fetch the job with its printer (for ink costs) inlined
+        const jobResponse = await api.get(`/jobs/${jobId}`, { params: { expand: 'printer' } });
+        const { printer: printerData, ...jobData } = jobResponse.data;
         setJob(jobData);
         
-        // 2. Fetch the job's printer (for ink costs)
-        if (jobData.printer_id) {
-          const printerResponse = await api.get(`/printers/${jobData.printer_id}`);
-          setPrinter(printerResponse.data);
+        if (printerData) {
+          setPrinter(printerData);
         } else {
-          throw new Error("Job has no printer ID.");
+          throw new Error("Job has no printer.");
         }
       } catch (err) {
         setError("Failed to fetch job details.");
@@ -23,7 +23,8 @@ const PrintersPage = () => {
       try {
         setLoading(true);
         setError(null);
-        const response = await api.get('/printers/');
+        // One request returns each printer with its recent activity
+        const response = await api.get('/printers/overview');
         setPrinters(response.data);
       } catch (err) {
         setError('Failed to fetch printers. Please try again.');
@@ -74,6 +75,8 @@ const PrintersPage = () => {
               <th>Model</th>
               <th>Serial Number</th>
               <th>Status</th>
+              <th>Last Job</th>
+              <th>Jobs (30d)</th>
               <th>Actions</th>
             </tr>
           </thead>
@@ -89,6 +92,12 @@ const PrintersPage = () => {
                 <td>{printer.model}</td>
                 <td>{printer.serial_number}</td>
                 <td>{printer.status}</td>
+                <td>
+                  {printer.activity.last_job_at
+                    ? new Date(printer.activity.last_job_at).toLocaleString()
+                    : 'Never'}
+                </td>
+                <td>{printer.activity.jobs_30d}</td>
                 <td style={{ textAlign: 'center' }}>
                   <Link 
                     to={`/printers/edit/${printer.id}`}
@@ -0,0 +1,8 @@
+"""
+Client library for shop-floor agents that report print jobs and ink fills
+to the portal. Requires httpx.
+"""
+from printerportal_agent.client import PortalAuthError, PortalClient, PortalError, PortalUnavailable
+from printerportal_agent.spool import PortalAgent, Spool, SpoolDrainer
+
+__all__ = ["PortalClient", "PortalAuthError", "PortalError", "PortalUnavailable", "PortalAgent", "Spool", "SpoolDrainer"]
@@ -0,0 +1,162 @@
+import asyncio
+import base64
+import gzip
+import json
+import time
+from datetime import date, datetime
+from typing import List, Optional
+
+import httpx
+
+# Bodies smaller than this are sent uncompressed; gzip would not pay off.
+GZIP_MIN_BYTES = 1024
+
+# Log in again this many seconds before the access token expires.
+TOKEN_REFRESH_MARGIN = 60
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class PortalError(Exception):
+    """The portal rejected a request; sending it again will not help."""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class PortalUnavailable(Exception):
+    """The portal could not be reached or is overloaded; the request may be retried."""
+
+
+class PortalAuthError(Exception):
+    """
+    The portal refused the agent's credentials. Nothing the agent sends can
+    succeed until they are fixed, so this is not a rejection of the request.
+    """
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _token_expiry(token: str) -> float:
+    """Reads `exp` from the JWT payload. The token is not verified; the portal does that."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, ValueError):
+        return 0.0
+
+
+class PortalClient:
+    """
+    Async client for the portal API used by shop-floor agents.
+
+    One pooled httpx client keeps connections alive across uploads, the
+    access token from /auth/token is cached until shortly before it expires
+    (or the portal answers 401), and JSON bodies above GZIP_MIN_BYTES are sent
+    gzip-compressed.
+
+        async with PortalClient("https://portal.example.com", email, password) as client:
+            await client.upload_jobs([job, job])
+    """
+
+    def __init__(self, base_url: str, email: str, password: str, *,
+                 timeout: float = 30.0, max_connections: int = 10,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.email = email
+        self._password = password
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    # --- Authentication ---
+
+    async def _login(self):
+        response = await self._send("POST", "/auth/token", data={"username": self.email, "password": self._password})
+        if response.status_code == 401:
+            raise PortalAuthError("Incorrect email or password")
+        self._token = response.json()["access_token"]
+        self._token_expires_at = _token_expiry(self._token)
+
+    async def _access_token(self, stale: Optional[str] = None) -> str:
+        async with self._login_lock:
+            # Another task may have refreshed the token while this one waited.
+            expiring = time.time() > self._token_expires_at - TOKEN_REFRESH_MARGIN
+            if self._token is None or self._token == stale or expiring:
+                await self._login()
+            return self._token
+
+    # --- Transport ---
+
+    async def _send(self, method: str, path: str, *, headers=None, content=None, data=None) -> httpx.Response:
+        try:
+            response = await self._http.request(method, path, headers=headers, content=content, data=data)
+        except httpx.TransportError as e:
+            raise PortalUnavailable(str(e)) from e
+        if response.status_code in RETRYABLE_STATUS:
+            raise PortalUnavailable(f"{response.status_code}: {response.text}")
+        if response.status_code >= 400 and response.status_code != 401:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise PortalError(response.status_code, detail)
+        return response
+
+    async def request(self, method: str, path: str, payload=None):
+        """Sends an authenticated JSON request and returns the decoded response."""
+        headers = {}
+        content = None
+        if payload is not None:
+            content = json.dumps(payload, default=_json_default).encode()
+            headers["Content-Type"] = "application/json"
+            if len(content) >= GZIP_MIN_BYTES:
+                content = gzip.compress(content, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+
+        token = await self._access_token()
+        for attempt in range(2):
+            headers["Authorization"] = f"Bearer {token}"
+            response = await self._send(method, path, headers=headers, content=content)
+            if response.status_code != 401:
+                return response.json() if response.content else None
+            # Expired or revoked early: log in again once, then give up.
+            token = await self._access_token(stale=token)
+        raise PortalAuthError("Could not authenticate with the portal")
+
+    # --- Endpoints ---
+
+    async def upload_job(self, job: dict) -> dict:
+        return await self.request("POST", "/jobs/", job)
+
+    async def upload_jobs(self, jobs: List[dict]) -> dict:
+        """Uploads up to 1000 jobs in one request via /jobs/batch."""
+        return await self.request("POST", "/jobs/batch", jobs)
+
+    async def record_ink_fill(self, printer_id: str, color: str, amount_litters: float,
+                              idempotency_key: Optional[str] = None) -> dict:
+        payload = {"color": color, "amount_litters": amount_litters}
+        if idempotency_key:
+            payload["idempotency_key"] = idempotency_key
+        return await self.request("POST", f"/printers/{printer_id}/ink-fill", payload)
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+import zlib
+from typing import Dict, List, Optional
+
+from printerportal_agent.client import PortalAuthError, PortalClient, PortalError, PortalUnavailable, _json_default
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+
+
+class Spool:
+    """
+    Durable, append-only queue of uploads waiting for the portal.
+
+    Records are appended to segment files as `<crc32> <json>` lines and
+    fsynced before append() returns, so an accepted record survives a crash.
+    A torn or corrupt tail line (from a crash mid-write) fails its checksum
+    and is truncated on open. Delivery progress is the highest sequence
+    number below which everything was acknowledged; it is written to
+    `committed` with an atomic rename. Segments wholly below it are deleted.
+    """
+
+    def __init__(self, directory: str, *, fsync: bool = True, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.committed = self._read_committed()
+        self._pending: Dict[int, dict] = {}
+        self._acked = set()
+        self._segments: List[int] = []
+        self._next_seq = self.committed + 1
+        self._recover()
+        self._file = None
+
+    # --- Files ---
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"spool-{first_seq:012d}.log")
+
+    def _read_committed(self) -> int:
+        try:
+            with open(os.path.join(self.directory, "committed")) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_committed(self):
+        path = os.path.join(self.directory, "committed")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.committed))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _encode(record: dict) -> bytes:
+        body = json.dumps(record, default=_json_default, separators=(",", ":")).encode()
+        return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[dict]:
+        if not line.endswith(b"\n") or len(line) < 10:
+            return None
+        crc, body = line[:8], line[9:-1]
+        try:
+            if int(crc, 16) != zlib.crc32(body):
+                return None
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    def _recover(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("spool-") and n.endswith(".log"))
+        for name in names:
+            first_seq = int(name[len("spool-"):-len(".log")])
+            path = os.path.join(self.directory, name)
+            valid_bytes = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    record = self._decode(line)
+                    if record is None:
+                        break
+                    valid_bytes += len(line)
+                    self._next_seq = max(self._next_seq, record["seq"] + 1)
+                    if record["seq"] > self.committed:
+                        self._pending[record["seq"]] = record
+            if valid_bytes < os.path.getsize(path):
+                logger.warning(f"Truncating damaged tail of spool segment {name}")
+                with open(path, "r+b") as f:
+                    f.truncate(valid_bytes)
+            self._segments.append(first_seq)
+        self._drop_delivered_segments()
+
+    def _drop_delivered_segments(self):
+        # A segment is delivered when the next one starts at or below committed + 1.
+        while len(self._segments) > 1 and self._segments[1] <= self.committed + 1:
+            os.remove(self._segment_path(self._segments.pop(0)))
+
+    # --- Queue ---
+
+    def append(self, kind: str, payload: dict) -> int:
+        """Durably stores one record and returns its sequence number."""
+        seq = self._next_seq
+        self._next_seq += 1
+        line = self._encode({"seq": seq, "kind": kind, "payload": payload})
+
+        if self._file is None or self._file.tell() + len(line) > self.segment_bytes:
+            if self._file is not None:
+                self._file.close()
+            if not self._segments or self._file is not None:
+                self._segments.append(seq)
+            self._file = open(self._segment_path(self._segments[-1]), "ab")
+        self._file.write(line)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        self._pending[seq] = {"seq": seq, "kind": kind, "payload": payload}
+        return seq
+
+    def pending(self, limit: Optional[int] = None) -> List[dict]:
+        """Records not yet acknowledged, oldest first."""
+        records = [self._pending[seq] for seq in sorted(self._pending)]
+        return records[:limit] if limit else records
+
+    def ack(self, seqs):
+        """Marks records as delivered and advances `committed` past any contiguous run."""
+        for seq in seqs:
+            if self._pending.pop(seq, None) is not None:
+                self._acked.add(seq)
+        advanced = False
+        while self.committed + 1 in self._acked:
+            self._acked.remove(self.committed + 1)
+            self.committed += 1
+            advanced = True
+        if advanced:
+            self._write_committed()
+            self._drop_delivered_segments()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class SpoolDrainer:
+    """
+    Delivers spooled records to the portal.
+
+    Jobs are sent in micro-batches through /jobs/batch and ink fills one by
+    one, with at most `concurrency` requests in flight. When the portal is
+    unreachable the drainer backs off exponentially (with jitter) up to
+    `max_delay`; records the portal rejects outright are moved to
+    `rejected.log` so they cannot block the queue. Refused credentials stop
+    delivery the same way as an outage, with everything kept spooled.
+    """
+
+    def __init__(self, client: PortalClient, spool: Spool, *, concurrency: int = 4,
+                 batch_size: int = 200, linger: float = 0.2,
+                 base_delay: float = 1.0, max_delay: float = 300.0):
+        self.client = client
+        self.spool = spool
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.linger = linger
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wakeup = asyncio.Event()
+        self._failures = 0
+
+    def notify(self):
+        """Wakes the drainer after new records were appended."""
+        self._wakeup.set()
+
+    def _reject(self, records: List[dict], error: PortalError):
+        logger.error(f"Portal rejected {len(records)} spooled record(s): {error}")
+        with open(os.path.join(self.spool.directory, "rejected.log"), "a") as f:
+            for record in records:
+                f.write(json.dumps({**record, "error": str(error)}, default=_json_default) + "\n")
+
+    async def _deliver(self, records: List[dict]):
+        try:
+            if records[0]["kind"] == "job":
+                await self.client.upload_jobs([r["payload"] for r in records])
+            else:
+                await self.client.record_ink_fill(**records[0]["payload"])
+        except PortalError as e:
+            if len(records) == 1:
+                self._reject(records, e)
+            else:
+                # The portal validates a batch as a whole; retry one by one so
+                # only the offending jobs are rejected.
+                for record in records:
+                    await self._deliver([record])
+                return
+        self.spool.ack(r["seq"] for r in records)
+
+    def _units(self, records: List[dict]) -> List[List[dict]]:
+        units, jobs = [], []
+        for record in records:
+            if record["kind"] == "job":
+                jobs.append(record)
+                if len(jobs) == self.batch_size:
+                    units.append(jobs)
+                    jobs = []
+            else:
+                units.append([record])
+        if jobs:
+            units.append(jobs)
+        return units
+
+    async def drain_once(self) -> bool:
+        """Sends everything pending. Returns False if the portal was unavailable or refused to log in."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unavailable = False
+
+        async def send(unit):
+            nonlocal unavailable
+            async with semaphore:
+                if unavailable:
+                    return
+                try:
+                    await self._deliver(unit)
+                except PortalUnavailable as e:
+                    logger.warning(f"Portal unavailable, keeping {len(unit)} record(s) spooled: {e}")
+                    unavailable = True
+                except PortalAuthError as e:
+                    logger.error(f"Portal refused the agent's credentials, keeping {len(unit)} record(s) spooled: {e}")
+                    unavailable = True
+
+        await asyncio.gather(*(send(unit) for unit in self._units(self.spool.pending())))
+        return not unavailable
+
+    def _backoff(self) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (self._failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run(self, stop: asyncio.Event):
+        """Drains until `stop` is set, then makes one last attempt."""
+        while not stop.is_set():
+            # Cleared before draining so appends made meanwhile are not missed.
+            self._wakeup.clear()
+            if len(self.spool):
+                # Give concurrent appends a moment to join the same batch.
+                await asyncio.sleep(self.linger)
+                if await self.drain_once():
+                    self._failures = 0
+                else:
+                    self._failures += 1
+
+            if self._failures:
+                waiters, timeout = [stop.wait()], self._backoff()
+            elif len(self.spool):
+                continue
+            else:
+                waiters, timeout = [stop.wait(), self._wakeup.wait()], None
+            tasks = [asyncio.ensure_future(waiter) for waiter in waiters]
+            await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
+        if len(self.spool):
+            await self.drain_once()
+
+
+class PortalAgent:
+    """
+    Offline-first front end for an agent: every job and ink fill is written
+    to the spool first and delivered in the background, so nothing is lost
+    while the portal is unreachable.
+
+        async with PortalAgent(url, email, password, "/var/spool/printerportal") as agent:
+            agent.submit_job(job)
+    """
+
+    def __init__(self, base_url: str, email: str, password: str, spool_dir: str, **drainer_options):
+        self.client = PortalClient(base_url, email, password)
+        self.spool = Spool(spool_dir)
+        self.drainer = SpoolDrainer(self.client, self.spool, **drainer_options)
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self.drainer.run(self._stop))
+        return self
+
+    async def __aexit__(self, *exc):
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+        self.spool.close()
+        await self.client.aclose()
+
+    def submit_job(self, job: dict) -> int:
+        """
+        Spools a job for upload. A random idempotency_key is assigned unless
+        one is given, so redelivery after a crash never duplicates the job.
+        """
+        job = {**job, "idempotency_key": job.get("idempotency_key") or uuid.uuid4().hex}
+        seq = self.spool.append("job", job)
+        self.drainer.notify()
+        return seq
+
+    def record_ink_fill(self, printer_id: str, color: str, amount_litters: float,
+                        idempotency_key: Optional[str] = None) -> int:
+        """Spools an ink fill for upload, with a random idempotency_key unless one is given, like submit_job."""
+        seq = self.spool.append("ink_fill", {
+            "printer_id": printer_id,
+            "color": color,
+            "amount_litters": amount_litters,
+            "idempotency_key": idempotency_key or uuid.uuid4().hex,
+        })
+        self.drainer.notify()
+        return seq
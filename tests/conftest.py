@@ -0,0 +1,100 @@
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.main import app as portal_app
+from backend.utils.analytics import AnalyticsEngine
+
+EMAIL = "agent@example.com"
+PASSWORD = "password1"
+
+PRINTER = {
+    "printer_name": "P1",
+    "printer_main_category": "Large Format",
+    "brand": "Brand",
+    "model": "Model",
+    "serial_number": "SN1",
+    "color_nos": 4,
+    "inks": ["Cyan", "Magenta", "Yellow", "Black"],
+    "specification": {
+        "printer_width": 3200,
+        "unit": "mm",
+        "print_head": "Konica",
+        "head_nos": 4,
+        "printer_control_system": "BYHX",
+    },
+    "location": "Hall A",
+    "department": "Print",
+    "ink_costs": {"Cyan": 100},
+}
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Serves requests from the in-process app and keeps them for inspection."""
+
+    def __init__(self, app):
+        self._inner = httpx.ASGITransport(app=app)
+        self.requests = []
+
+    async def handle_async_request(self, request):
+        self.requests.append(request)
+        return await self._inner.handle_async_request(request)
+
+    def sent(self, path: str) -> list:
+        return [r for r in self.requests if r.url.path == path]
+
+
+@pytest.fixture
+def app():
+    # ASGITransport does not run startup handlers, so the app gets an
+    # in-memory database here instead of connecting to MongoDB.
+    portal_app.mongodb_client = AsyncMongoMockClient()
+    portal_app.db = portal_app.mongodb_client["printerportal_test"]
+    portal_app.analytics = AnalyticsEngine()
+    return portal_app
+
+
+@pytest.fixture
+def transport(app):
+    return RecordingTransport(app)
+
+
+async def register(transport) -> str:
+    """Creates the test user and one printer; returns the printer's id."""
+    async with httpx.AsyncClient(transport=transport, base_url="http://portal") as http:
+        await http.post("/auth/register", json={"email": EMAIL, "password": PASSWORD})
+        token = (await http.post("/auth/token", data={"username": EMAIL, "password": PASSWORD})).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+        await http.post("/printers/", json=PRINTER, headers=headers)
+        printers = (await http.get("/printers/", headers=headers)).json()
+    transport.requests.clear()
+    return printers[0]["id"]
+
+
+def make_job(printer_id: str, i: int = 0, **overrides) -> dict:
+    job = {
+        "printer_id": printer_id,
+        "owner_email": EMAIL,
+        "job_name": f"job-{i}",
+        "job_status": "Completed",
+        "copies": 1,
+        "print_date": f"2024-01-{1 + i % 28:02d}T10:00:00",
+        "width_mm": 1000,
+        "length_mm": 2000,
+        "printed_area_sqm": 2.0,
+        "printed_length_m": 2.0,
+        "total_ink_ml": 10.0,
+        "ink_consumption_ml": {"Cyan": 5.0, "Black": 5.0},
+        "dpi_x": 720,
+        "dpi_y": 720,
+        "print_mode": "Quality",
+        "speed": "Normal",
+        "printed_pass": 4,
+    }
+    job.update(overrides)
+    return job
@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+
+from conftest import EMAIL, PASSWORD, make_job, register
+from printerportal_agent import PortalClient, Spool, SpoolDrainer
+from printerportal_agent.client import GZIP_MIN_BYTES
+
+
+def portal_client(transport, password: str = PASSWORD) -> PortalClient:
+    return PortalClient("http://portal", EMAIL, password, transport=transport)
+
+
+async def stored_jobs(client: PortalClient) -> list:
+    return await client.request("GET", "/jobs/")
+
+
+def test_token_is_cached_and_refreshed(transport):
+    async def scenario():
+        printer_id = await register(transport)
+        async with portal_client(transport) as client:
+            await client.upload_job(make_job(printer_id, 0))
+            await client.upload_job(make_job(printer_id, 1))
+            assert len(transport.sent("/auth/token")) == 1
+
+            # Close to expiry: log in again before sending.
+            client._token_expires_at = time.time()
+            await client.upload_job(make_job(printer_id, 2))
+            assert len(transport.sent("/auth/token")) == 2
+
+            # Revoked early: the 401 triggers one fresh login and a resend.
+            client._token = "not-a-valid-token"
+            client._token_expires_at = time.time() + 3600
+            await client.upload_job(make_job(printer_id, 3))
+            assert len(transport.sent("/auth/token")) == 3
+
+            assert len(await stored_jobs(client)) == 4
+
+    asyncio.run(scenario())
+
+
+def test_large_bodies_are_gzipped(transport):
+    async def scenario():
+        printer_id = await register(transport)
+        async with portal_client(transport) as client:
+            await client.upload_job(make_job(printer_id, 0))
+            [small] = transport.sent("/jobs/")
+            assert "content-encoding" not in small.headers
+
+            jobs = [make_job(printer_id, i) for i in range(1, 21)]
+            await client.upload_jobs(jobs)
+            [large] = transport.sent("/jobs/batch")
+            assert large.headers["content-encoding"] == "gzip"
+            assert len(json.dumps(jobs)) >= GZIP_MIN_BYTES
+            assert json.loads(gzip.decompress(large.content))[0]["job_name"] == "job-1"
+
+            assert len(await stored_jobs(client)) == 21
+
+    asyncio.run(scenario())
+
+
+def test_batch_upload_skips_duplicates(transport):
+    async def scenario():
+        printer_id = await register(transport)
+        async with portal_client(transport) as client:
+            jobs = [make_job(printer_id, i, idempotency_key=f"key-{i}") for i in range(3)]
+            first = await client.upload_jobs(jobs + [jobs[0]])
+            assert [r["duplicate"] for r in first["results"]] == [False, False, False, True]
+            assert first["results"][3]["job_id"] == first["results"][0]["job_id"]
+
+            again = await client.upload_jobs(jobs)
+            assert all(r["duplicate"] for r in again["results"])
+            assert [r["job_id"] for r in again["results"]] == [r["job_id"] for r in first["results"][:3]]
+            assert len(await stored_jobs(client)) == 3
+
+    asyncio.run(scenario())
+
+
+def test_spool_truncates_torn_tail(tmp_path):
+    spool = Spool(str(tmp_path), fsync=False)
+    for i in range(3):
+        spool.append("job", {"job_name": f"job-{i}"})
+    spool.close()
+
+    [segment] = [name for name in os.listdir(tmp_path) if name.startswith("spool-")]
+    path = tmp_path / segment
+    intact = path.stat().st_size
+    with open(path, "ab") as f:
+        # A crash in the middle of writing the fourth record.
+        f.write(Spool._encode({"seq": 4, "kind": "job", "payload": {"job_name": "job-3"}})[:-7])
+
+    spool = Spool(str(tmp_path), fsync=False)
+    assert [r["seq"] for r in spool.pending()] == [1, 2, 3]
+    assert path.stat().st_size == intact
+
+    assert spool.append("job", {"job_name": "job-3"}) == 4
+    spool.close()
+    assert [r["payload"]["job_name"] for r in Spool(str(tmp_path)).pending()] == ["job-0", "job-1", "job-2", "job-3"]
+
+
+def test_redelivery_after_restart_is_deduplicated(transport, tmp_path):
+    async def scenario():
+        printer_id = await register(transport)
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append("job", make_job(printer_id, 0, idempotency_key="job-key"))
+        spool.append("ink_fill", {
+            "printer_id": printer_id, "color": "Cyan", "amount_litters": 1.0, "idempotency_key": "fill-key",
+        })
+
+        async with portal_client(transport) as client:
+            # Delivered, but the agent dies before acknowledging the records.
+            for record in spool.pending():
+                if record["kind"] == "job":
+                    await client.upload_jobs([record["payload"]])
+                else:
+                    await client.record_ink_fill(**record["payload"])
+            spool.close()
+
+            spool = Spool(str(tmp_path), fsync=False)
+            assert len(spool) == 2
+            assert await SpoolDrainer(client, spool).drain_once()
+            assert len(spool) == 0
+
+            assert len(await stored_jobs(client)) == 1
+            assert len(await client.request("GET", f"/printers/{printer_id}/ink-fills")) == 1
+        spool.close()
+
+    asyncio.run(scenario())
+
+
+def test_refused_login_keeps_records_spooled(transport, tmp_path):
+    async def scenario():
+        printer_id = await register(transport)
+        spool = Spool(str(tmp_path), fsync=False)
+        spool.append("job", make_job(printer_id, 0))
+        spool.append("ink_fill", {"printer_id": printer_id, "color": "Cyan", "amount_litters": 1.0})
+
+        async with portal_client(transport, password="wrong-password") as client:
+            assert not await SpoolDrainer(client, spool).drain_once()
+        assert len(spool) == 2
+        assert not os.path.exists(tmp_path / "rejected.log")
+        spool.close()
+
+    asyncio.run(scenario())
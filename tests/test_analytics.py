@@ -0,0 +1,189 @@
+import asyncio
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.models.analytics_model import AnalyticsQuery
+from backend.utils import analytics, job_store
+from backend.utils.analytics import AnalyticsEngine, AnalyticsQueryError, TenantTable
+from conftest import EMAIL, make_job
+
+
+def query(*filters) -> AnalyticsQuery:
+    return AnalyticsQuery(
+        filters=[{"field": field, "op": op, "value": value} for field, op, value in filters],
+        metrics=[{"agg": "count"}],
+    )
+
+
+@pytest.mark.parametrize("flt", [
+    ("total_ink_ml", "gt", "ten"),
+    ("total_ink_ml", "eq", None),
+    ("total_ink_ml", "eq", True),
+    ("total_ink_ml", "in", [1, "2"]),
+    ("total_ink_ml", "in", 5),
+    ("print_mode", "in", "Quality"),
+    ("print_mode", "eq", ["Quality"]),
+    ("print_mode", "eq", {"$ne": "Quality"}),
+])
+def test_filters_with_mismatched_values_are_rejected(flt):
+    with pytest.raises(AnalyticsQueryError):
+        TenantTable().query(query(flt))
+
+
+def test_well_typed_filters_are_accepted():
+    TenantTable().query(query(
+        ("total_ink_ml", "gte", 1.5),
+        ("copies", "in", [1, 2]),
+        ("print_mode", "in", ["Quality", "Draft"]),
+        ("job_status", "ne", "Failed"),
+    ))
+
+
+async def add_printer(db, **fields) -> str:
+    result = await db["printers"].insert_one({"owner_email": EMAIL, "department": "Print", "ink_costs": {}, **fields})
+    return str(result.inserted_id)
+
+
+async def add_job(db, printer_id: str, i: int = 0):
+    doc = await job_store.encode_job(db, make_job(printer_id, i))
+    doc["_id"] = ObjectId()
+    await job_store.collection(db).insert_one(doc)
+
+
+def test_workers_pick_up_printer_changes_made_elsewhere():
+    async def scenario():
+        db = AsyncMongoMockClient()["printerportal_test"]
+        spec = AnalyticsQuery(group_by=["department"], metrics=[{"agg": "count"}, {"agg": "sum", "field": "ink_cost"}])
+        worker_a, worker_b = AnalyticsEngine(), AnalyticsEngine()
+        first = await add_printer(db, ink_costs={"Cyan": 100})
+        await add_job(db, first, 0)
+        assert (await worker_b.table(db, EMAIL)).size == 1
+
+        # Registered and used through worker A; B has never heard of the printer.
+        second = await add_printer(db)
+        await add_job(db, second, 1)
+        assert (await worker_a.table(db, EMAIL)).size == 2
+        assert (await worker_b.table(db, EMAIL)).size == 2
+
+        # Repriced and moved to another department, again behind B's back.
+        await db["printers"].update_one(
+            {"_id": ObjectId(first)}, {"$set": {"ink_costs": {"Cyan": 200}, "department": "Finishing"}}
+        )
+        rows = (await worker_b.table(db, EMAIL)).query(spec)
+        assert {r["department"]: (r["count"], r["sum_ink_cost"]) for r in rows} == {
+            "Finishing": (1.0, 1.0), "Print": (1.0, 0.0),
+        }
+
+        await db["printers"].delete_one({"_id": ObjectId(second)})
+        assert (await worker_b.table(db, EMAIL)).size == 1
+
+    asyncio.run(scenario())
+
+
+def random_table(n: int = 500, seed: int = 7) -> TenantTable:
+    rng = np.random.default_rng(seed)
+    table = TenantTable()
+    for i in range(n):
+        table.append(ObjectId(), {
+            "printer_id": f"printer-{rng.integers(3)}",
+            "print_mode": ["Quality", "Draft"][rng.integers(2)],
+            "copies": int(rng.integers(1, 4)),
+            "total_ink_ml": None if i % 17 == 0 else float(rng.uniform(1, 50)),
+            "printed_area_sqm": float(rng.uniform(0.5, 5)),
+            "print_ts": float(i),
+        })
+    return table
+
+
+def test_group_by_metrics_match_a_row_by_row_reference():
+    table = random_table()
+    rows = table.query(AnalyticsQuery(
+        group_by=["printer_id", "print_mode"],
+        filters=[{"field": "copies", "op": "lte", "value": 2}],
+        metrics=[
+            {"agg": "count"},
+            {"agg": "sum", "field": "total_ink_ml"},
+            {"agg": "mean", "field": "total_ink_ml"},
+            {"agg": "min", "field": "total_ink_ml"},
+            {"agg": "max", "field": "total_ink_ml"},
+            {"agg": "percentile", "field": "total_ink_ml", "q": 90},
+            {"agg": "ratio", "field": "total_ink_ml", "per": "printed_area_sqm"},
+        ],
+    ))
+
+    printers = np.array(table.dictionaries["printer_id"].values)[table.codes["printer_id"][:table.size]]
+    modes = np.array(table.dictionaries["print_mode"].values)[table.codes["print_mode"][:table.size]]
+    ink = table.numeric["total_ink_ml"][:table.size]
+    area = table.numeric["printed_area_sqm"][:table.size]
+    selected = table.numeric["copies"][:table.size] <= 2
+    expected = {}
+    for printer, mode in set(zip(printers[selected], modes[selected])):
+        rows_of = selected & (printers == printer) & (modes == mode)
+        values = ink[rows_of][~np.isnan(ink[rows_of])]
+        expected[(printer, mode)] = {
+            "count": rows_of.sum(),
+            "sum_total_ink_ml": values.sum(),
+            "mean_total_ink_ml": values.mean(),
+            "min_total_ink_ml": values.min(),
+            "max_total_ink_ml": values.max(),
+            "p90_total_ink_ml": np.percentile(values, 90),
+            "total_ink_ml_per_printed_area_sqm": values.sum() / area[rows_of].sum(),
+        }
+
+    assert len(rows) == len(expected) == 6
+    for row in rows:
+        for name, value in expected[(row["printer_id"], row["print_mode"])].items():
+            assert row[name] == pytest.approx(value)
+
+
+def test_numeric_group_by_labels_are_numbers():
+    rows = random_table().query(AnalyticsQuery(group_by=["copies"], metrics=[{"agg": "count"}]))
+    assert sorted(row["copies"] for row in rows) == [1, 2, 3]
+    assert sum(row["count"] for row in rows) == 500
+
+
+def test_too_many_groups_are_rejected(monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_MAX_GROUPS", 100)
+    with pytest.raises(AnalyticsQueryError):
+        random_table().query(AnalyticsQuery(group_by=["print_ts"], metrics=[{"agg": "count"}]))
+
+
+def test_snapshot_ignores_later_appends_and_drops():
+    table = random_table()
+    view = table.snapshot()
+    for _ in range(2000):
+        table.append(ObjectId(), {"printer_id": "printer-9", "total_ink_ml": 1.0})
+    table.drop_printer("printer-0")
+
+    spec = AnalyticsQuery(metrics=[{"agg": "count"}, {"agg": "sum", "field": "print_ts"}])
+    assert view.query(spec) == [{"count": 500.0, "sum_print_ts": float(sum(range(500)))}]
+    assert table.query(spec)[0]["count"] < 2500
+
+
+def test_catch_up_adds_only_jobs_it_does_not_hold():
+    async def scenario():
+        db = AsyncMongoMockClient()["printerportal_test"]
+        engine = AnalyticsEngine()
+        printer_id = await add_printer(db)
+        for i in range(3):
+            await add_job(db, printer_id, i)
+        table = await engine.table(db, EMAIL)
+        assert table.size == 3
+
+        # Ingested on this worker: appended directly, then seen again by catch-up.
+        job = make_job(printer_id, 3)
+        doc = await job_store.encode_job(db, job)
+        doc["_id"] = ObjectId()
+        await job_store.collection(db).insert_one(doc)
+        engine.append_job(EMAIL, doc["_id"], job, {"department": "Print"})
+        assert table.size == 4
+
+        # Ingested on another worker: only catch-up sees it.
+        await add_job(db, printer_id, 4)
+        assert (await engine.table(db, EMAIL)).size == 5
+        assert (await engine.table(db, EMAIL)).size == 5
+
+    asyncio.run(scenario())
@@ -0,0 +1,174 @@
+import asyncio
+
+import bson
+import pytest
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.models.job_model import PrintJob
+from backend.routers.jobs import job_helper
+from backend.utils import job_codec, job_store
+from conftest import EMAIL, make_job
+
+INKS = ["Cyan", "Magenta", "Yellow", "Black"]
+
+PRINT_DATES = [
+    "2024-01-05T10:00:00",
+    "2024-01-05T10:00:00.123000",
+    "2024-01-05T10:00:00.123456",
+    "2024-01-05T12:00:00+02:00",
+    "2024-01-05T10:00:00+00:00",
+    "2024-01-05T12:00:00.000500-01:30",
+]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # The interners cache per process; give each test empty ones to match its database.
+    monkeypatch.setattr(job_codec, "TENANTS", job_codec.Interner(job_codec.TENANTS_COLLECTION))
+    monkeypatch.setattr(job_codec, "INK_LAYOUTS", job_codec.Interner(
+        job_codec.INK_LAYOUTS_COLLECTION,
+        to_key=job_codec.INK_LAYOUTS.to_key,
+        from_key=job_codec.INK_LAYOUTS.from_key,
+    ))
+    return AsyncMongoMockClient()["printerportal_test"]
+
+
+def uploaded(**overrides) -> dict:
+    """A job as ingest hands it to job_store: validated, then JSON-encoded."""
+    job = jsonable_encoder(PrintJob(**make_job(str(ObjectId()), 0, **overrides)))
+    job.pop("idempotency_key", None)
+    return job
+
+
+def stored(doc: dict) -> dict:
+    """What MongoDB gives back for `doc`: dates in naive UTC, truncated to milliseconds."""
+    return bson.decode(bson.encode({"_id": ObjectId(), **doc}))
+
+
+async def store(db, monkeypatch, layout: str, job: dict) -> dict:
+    monkeypatch.setattr(job_store, "PRINT_JOBS_COMPACT", layout == "compact")
+    monkeypatch.setattr(job_store, "PRINT_JOBS_TIMESERIES", layout == "timeseries")
+    doc = stored(await job_store.encode_job(db, job, INKS))
+    await job_store.prime(db, [doc])
+    return doc
+
+
+@pytest.mark.parametrize("layout", ["compact", "timeseries"])
+@pytest.mark.parametrize("print_date", PRINT_DATES)
+def test_decode_job_matches_the_plain_layout(db, monkeypatch, layout, print_date):
+    async def scenario():
+        job = uploaded(print_date=print_date)
+        plain = await store(db, monkeypatch, "plain", job)
+        expected = job_helper(plain)
+        doc = await store(db, monkeypatch, layout, job)
+        assert job_helper({**doc, "_id": plain["_id"]}) == expected
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("print_date", PRINT_DATES)
+def test_print_date_text_is_kept_only_when_the_date_loses_it(db, print_date):
+    async def scenario():
+        job = uploaded(print_date=print_date)
+        doc = stored(await job_codec.encode(db, job, INKS))
+        text = doc.get(job_codec.SHORT_KEYS[job_codec.PRINT_DATE_TEXT])
+        if text is None:
+            assert doc["d"].isoformat() == job["print_date"]
+        else:
+            assert text == job["print_date"]
+        await job_codec.prime(db, [doc])
+        decoded = job_codec.decode(doc)
+        assert job_codec.PRINT_DATE_TEXT not in decoded
+        assert (decoded["print_date"] if text else decoded["print_date"].isoformat()) == job["print_date"]
+
+    asyncio.run(scenario())
+
+
+def test_pack_unpack_round_trip(db):
+    async def scenario():
+        job = uploaded(print_mode="Draft", ink_consumption_ml={"Black": 1.5, "Cyan": 2.0})
+        doc = await job_codec.encode(db, job, INKS)
+        assert set(doc) <= set(job_codec.SHORT_KEYS.values()) | {job_codec.LAYOUT_KEY}
+        doc = stored(doc)
+        await job_codec.prime(db, [doc])
+        decoded = job_codec.decode(doc)
+        assert decoded.pop("_id") == doc["_id"]
+        assert decoded.pop("printer_id") == ObjectId(job.pop("printer_id"))
+        assert decoded.pop("print_date").isoformat() == job.pop("print_date")
+        assert decoded == job
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("consumption", [{}, None, "missing"])
+def test_jobs_without_ink_maps(db, monkeypatch, consumption):
+    async def scenario():
+        job = uploaded()
+        if consumption == "missing":
+            del job["ink_consumption_ml"]
+        else:
+            job["ink_consumption_ml"] = consumption
+        doc = await job_codec.encode(db, job, INKS)
+        assert job_codec.LAYOUT_KEY not in doc and "i" not in doc
+        assert "ink_consumption_ml" not in job_codec.unpack(doc, lambda i: EMAIL, None)
+        assert await db[job_codec.INK_LAYOUTS_COLLECTION].count_documents({}) == 0
+
+        doc = await store(db, monkeypatch, "compact", job)
+        assert job_helper(doc)["ink_consumption_ml"] == {}
+
+    asyncio.run(scenario())
+
+
+def test_ink_layout_follows_the_printer_order(db):
+    async def scenario():
+        assert job_codec.ink_layout({"White": 1, "Black": 2, "Cyan": 3}, INKS) == ("Cyan", "Black", "White")
+        assert job_codec.ink_layout({"Orange": 1, "Green": 2}) == ("Green", "Orange")
+
+        first = await job_codec.encode(db, uploaded(ink_consumption_ml={"Black": 1.0, "Cyan": 2.0}), INKS)
+        second = await job_codec.encode(db, uploaded(ink_consumption_ml={"Cyan": 3.0, "Black": 4.0}), INKS)
+        assert first["k"] == second["k"]
+        assert (first["i"], second["i"]) == ([2.0, 1.0], [3.0, 4.0])
+        assert job_codec.INK_LAYOUTS.value(first["k"]) == ("Cyan", "Black")
+
+        # The same colors under another printer's order are a different layout.
+        third = await job_codec.encode(db, uploaded(ink_consumption_ml={"Cyan": 5.0, "Black": 6.0}), ["Black", "Cyan"])
+        assert third["k"] != first["k"]
+        assert job_codec.decode(third)["ink_consumption_ml"] == {"Black": 6.0, "Cyan": 5.0}
+
+    asyncio.run(scenario())
+
+
+def test_lookup_never_allocates(db, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(job_store, "PRINT_JOBS_COMPACT", True)
+        tenants = job_codec.TENANTS
+        assert await tenants.lookup(db, EMAIL) is None
+        assert await job_store.owner_value(db, EMAIL) is None
+        assert await db[job_codec.TENANTS_COLLECTION].count_documents({}) == 0
+        assert await db[job_codec.COUNTERS_COLLECTION].count_documents({}) == 0
+
+        tenant_id = await tenants.id_for(db, EMAIL)
+        assert await tenants.id_for(db, EMAIL) == tenant_id
+        assert await tenants.id_for(db, "other@example.com") != tenant_id
+        assert await tenants.lookup(db, EMAIL) == tenant_id
+
+        # Another worker starts with an empty cache and finds the same id.
+        fresh = job_codec.Interner(job_codec.TENANTS_COLLECTION)
+        assert await fresh.lookup(db, EMAIL) == tenant_id
+        assert await fresh.lookup(db, "nobody@example.com") is None
+        assert await db[job_codec.TENANTS_COLLECTION].count_documents({}) == 2
+
+    asyncio.run(scenario())
+
+
+def test_compact_query_for_an_unknown_owner_matches_nothing(db, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(job_store, "PRINT_JOBS_COMPACT", True)
+        await job_store.collection(db).insert_one(await job_store.encode_job(db, uploaded(), INKS))
+        query = await job_store.job_query(db, "nobody@example.com")
+        assert await job_store.collection(db).count_documents(query) == 0
+        assert await db[job_codec.TENANTS_COLLECTION].count_documents({}) == 1
+
+    asyncio.run(scenario())